@@ -0,0 +1,160 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : imports.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Import time benchmark of each clirel command.
+           Runs each command in a fresh interpreter on data/i2b2_examples,
+           with the import statement timed, and reports the time spent
+           importing each top level package and the total run time.
+           Commands run on a copy of clirel and the model (see
+           run.sandbox), so the model files and predictions of this tree
+           are left alone.
+           With --check, fails if a command fails or imports a package it
+           should not (see _UNUSED), to keep start up fast.
+
+           python imports.py [--check] [--out FILE] [--model DIR]
+
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import getopt
+import subprocess
+
+def absPath(path):
+  """ Return absolute path from where this file is located """
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+# Packages each command has no use for, with the modules of kim that only
+# some of its options use.
+_UNUSED = {'usage': ['numpy', 'pandas', 'sklearn'],
+           'train': ['sklearn', 'gram', 'learn', 'kernel', 'workqueue'],
+           'test':  ['sklearn', 'gram', 'learn', 'kernel', 'scheduler',
+                     'workqueue'],
+           'eval':  []}
+
+def commands(data, model, predictions):
+  """
+    The arguments of each command benchmarked. Models are given the parse
+    directory of the data (see kim), others ignore it.
+  """
+  parse = os.path.join(data, 'parse')
+  return [('usage', []),
+          ('train', ['train', data, model, parse]),
+          ('test',  ['test',  data, model, parse]),
+          ('eval',  ['eval',  data, predictions])]
+
+def child(clirel, args):
+  """
+    Runs clirel.py with args in this process, timing each import made while
+    no other is running (so nested imports count towards the outer one),
+    and prints the times and the packages loaded as JSON on the last line
+    of stderr.
+  """
+  import __builtin__
+  real = __builtin__.__import__
+  times = dict()
+  depth = [0]
+
+  def timedImport(name, *args, **kwargs):
+    top = name.split('.')[0]
+    if depth[0] > 0 or top in sys.modules:
+      return real(name, *args, **kwargs)
+    depth[0] += 1
+    start = time.time()
+    try:
+      return real(name, *args, **kwargs)
+    finally:
+      depth[0] -= 1
+      times[top] = times.get(top, 0.0) + time.time() - start
+
+  sys.argv = [clirel] + args
+  sys.path.insert(0, os.path.dirname(clirel))
+  __builtin__.__import__ = timedImport
+  start = time.time()
+  error = None
+  try:
+    execfile(clirel, {'__name__': '__main__', '__file__': clirel})
+  except SystemExit:
+    pass
+  except Exception as e:
+    error = '%s: %s' % (type(e).__name__, e)
+  finally:
+    __builtin__.__import__ = real
+  loaded = sorted(set(m.split('.')[0] for m in sys.modules))
+  sys.stderr.write('\n' + json.dumps({'seconds': time.time() - start,
+                                      'imports': times,
+                                      'loaded': loaded,
+                                      'error': error}) + '\n')
+
+def run(model):
+  """
+    Benchmarks each command, returns a dict of name: {'seconds',
+    'importSeconds', 'imports', 'loaded', 'unused', 'error'}.
+  """
+  # Imported here, as run.py puts src and kim on the path of children.
+  from run import sandbox
+
+  data = absPath('../data/i2b2_examples')
+  d, clirel, model = sandbox(model)
+  out = dict()
+  try:
+    for name, args in commands(data, model, os.path.join(d, 'predictions')):
+      env = dict(os.environ, CLIREL_CACHE='', CLIREL_REPORTS='')
+      proc = subprocess.Popen([sys.executable, __file__, '--child', clirel] +
+                              args, stdout=subprocess.PIPE,
+                              stderr=subprocess.PIPE, env=env)
+      _, err = proc.communicate()
+      result = json.loads(err.strip().splitlines()[-1])
+      result['importSeconds'] = sum(result['imports'].values())
+      result['unused'] = [p for p in _UNUSED[name] if p in result['loaded']]
+      out[name] = result
+  finally:
+    shutil.rmtree(d)
+  return out
+
+if __name__ == '__main__':
+  if sys.argv[1:2] == ['--child']:
+    child(sys.argv[2], sys.argv[3:])
+    sys.exit(0)
+
+  try:
+    flags, args = getopt.gnu_getopt(sys.argv[1:], '',
+                                    ['check', 'out=', 'model='])
+  except getopt.GetoptError:
+    print "USAGE: python imports.py [--check] [--out FILE] [--model DIR]"
+    sys.exit(1)
+  flags = dict(flags)
+
+  results = run(os.path.abspath(flags.get('--model',
+                                          absPath('../model/infrandom'))))
+
+  print "%-8s %10s %10s  %s" % ('Command', 'Seconds', 'Imports', 'Slowest')
+  failed = False
+  for name, args in commands('', '', ''):
+    r = results[name]
+    slowest = sorted(r['imports'].items(), key=lambda i: -i[1])[:3]
+    print "%-8s %10.3f %10.3f  %s" % (name, r['seconds'], r['importSeconds'],
+                                      ', '.join('%s %.3f' % i
+                                                for i in slowest))
+    if r['error']:
+      failed = True
+      print "         failed: %s" % r['error']
+    if r['unused']:
+      failed = True
+      print "         imports unused: %s" % ', '.join(r['unused'])
+
+  if '--out' in flags:
+    with open(flags['--out'], 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+
+  if failed and '--check' in flags:
+    sys.exit(1)
@@ -0,0 +1,137 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : memory.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Measures the memory taken by the concept pairs of a synthetic
+           corpus (see synth.py), held all at once, in three forms:
+             rows   - tuples from note.pairCons made into a table, with the
+                      sentence merged on (how tables used to be built)
+             tables - the tables of note.createTesting
+             pairs  - the compact stores of pairs.py, with their sentences
+           Each is built in a fresh process and measured by its growth in
+           peak resident memory.
+
+           python memory.py [--docs N] [--lines N] [--concepts N]
+
+"""
+
+import os
+import sys
+import json
+import getopt
+import shutil
+import resource
+import tempfile
+import subprocess
+
+import synth
+
+def absPath(path):
+  """ Return absolute path from where this file is located """
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+sys.path.insert(0, absPath('../src'))
+
+_FORMS = ['rows', 'tables', 'pairs']
+
+def build(form, corpus):
+  """
+    Builds the pairs of every document of the corpus in the given form.
+    Returns them and the number of pairs.
+  """
+  import note
+  import pairs
+  import pandas as pd
+  from pandas import DataFrame
+
+  cons = note.filterFiles(os.path.join(corpus, 'concept'), 'con')
+  txts = note.filterFiles(os.path.join(corpus, 'txt'), 'txt')
+
+  out = list()
+  n = 0
+  for c, t in zip(cons, txts):
+    if form == 'tables':
+      X = note.createTesting(c, t)
+      n += len(X)
+      out.append(X)
+      continue
+
+    with open(c, 'r') as f:
+      data = [note.extractConsFromText(line) for line in f]
+    with open(t, 'r') as f:
+      sentences = [line.strip() for line in f]
+
+    if form == 'pairs':
+      p = pairs.Pairs(note.docName(c), data)
+      n += len(p)
+      out.append((p, sentences))
+    else:
+      X = DataFrame(list(note.pairCons(data)), columns=pairs.COLUMNS)
+      X['fileName'] = note.docName(c)
+      X['relType'] = float('nan')
+      text = DataFrame({'lineNum': range(1, len(sentences) + 1),
+                        'text': sentences})
+      text['fileName'] = note.docName(c)
+      X = pd.merge(X, text, how='left')
+      n += len(X)
+      out.append(X)
+  return out, n
+
+def child(form, corpus):
+  """
+    Prints the pairs built and the growth of peak memory in bytes, as JSON.
+  """
+  # Load the libraries first, they are not part of the measure.
+  import note
+  import pairs
+  import pandas
+
+  before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  held, n = build(form, corpus)
+  after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  scale = 1 if sys.platform == 'darwin' else 1024
+  print json.dumps({'pairs': n, 'bytes': (after - before) * scale})
+
+def measure(corpus):
+  """
+    Returns the pairs and bytes of each form.
+  """
+  out = dict()
+  for form in _FORMS:
+    result = subprocess.check_output([sys.executable, __file__, '--child',
+                                      form, corpus])
+    out[form] = json.loads(result.strip().splitlines()[-1])
+  return out
+
+if __name__ == '__main__':
+  if sys.argv[1:2] == ['--child']:
+    child(sys.argv[2], sys.argv[3])
+    sys.exit(0)
+
+  try:
+    flags, args = getopt.gnu_getopt(sys.argv[1:], '',
+                                    [k + '=' for k in synth._DEFAULTS])
+    opts = dict((o[2:], int(v)) for o, v in flags)
+  except (getopt.GetoptError, ValueError):
+    print "USAGE: python memory.py [--docs N] [--lines N] [--concepts N]"
+    sys.exit(1)
+  opts.setdefault('docs', 200)
+
+  corpus = tempfile.mkdtemp()
+  try:
+    synth.generate(corpus, **opts)
+    results = measure(corpus)
+  finally:
+    shutil.rmtree(corpus)
+
+  print "%-8s %10s %12s %14s" % ('Form', 'Pairs', 'MB', 'Bytes/pair')
+  for form in _FORMS:
+    r = results[form]
+    print "%-8s %10d %12.1f %14.1f" % (form, r['pairs'],
+                                       r['bytes'] / 2.0 ** 20,
+                                       float(r['bytes']) / max(r['pairs'], 1))
@@ -0,0 +1,251 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : run.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Benchmarks the pipeline on synthetic corpora (see synth.py) of
+           several sizes. For each size, times the stages of note.py and
+           tree.py in this process, and clirel train, test and eval as they
+           are run by users. Results are written as JSON so runs can be
+           compared over time.
+
+           python run.py [--sizes 10,100,1000] [--model DIR] [--out FILE]
+                         [--keep DIR] [--cache]
+
+           By default the document cache of clirel is not used (CLIREL_CACHE
+           is emptied), so every run does all of the work.
+           clirel and the model are run from a copy (see sandbox), so the
+           trained model files and predictions of this tree are left alone.
+
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import getopt
+import platform
+import tempfile
+import subprocess
+
+import synth
+
+def absPath(path):
+  """ Return absolute path from where this file is located """
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+sys.path.insert(0, absPath('../src'))
+sys.path.insert(0, absPath('../model/kim'))
+
+def timed(func, *args):
+  """
+    Returns the result of func(*args) and the seconds it took.
+    >>> timed(sum, [1, 2])[0]
+    3
+  """
+  start = time.time()
+  out = func(*args)
+  return out, time.time() - start
+
+def stages(corpus):
+  """
+    Times the internal stages over every document of the corpus. Returns a
+    dict of stage: {'seconds', 'rows'}.
+  """
+  import note
+  import tree
+
+  out = dict()
+  def add(name, seconds, rows):
+    s = out.setdefault(name, {'seconds': 0.0, 'rows': 0})
+    s['seconds'] += seconds
+    s['rows'] += rows
+
+  cons = note.filterFiles(os.path.join(corpus, 'concept'), 'con')
+  txts = note.filterFiles(os.path.join(corpus, 'txt'), 'txt')
+  rels = note.filterFiles(os.path.join(corpus, 'rel'), 'rel')
+  pars = note.filterFiles(os.path.join(corpus, 'parse'), 'parse')
+
+  for c, t, r, p in zip(cons, txts, rels, pars):
+    X, s = timed(note.createTraining, c, t, r)
+    add('note.createTraining', s, len(X) if X is not None else 0)
+    Y, s = timed(note.createTesting, c, t)
+    add('note.createTesting', s, len(Y) if Y is not None else 0)
+
+    with open(p, 'r') as f:
+      lines = [line.strip()[2:-2] for line in f]
+    trees, s = timed(lambda: [tree.createTree(l) for l in lines])
+    add('tree.createTree', s, len(lines))
+
+    if X is None:
+      continue
+    # Concepts in the order they appear, as kim gives them to tree.py.
+    rows = list()
+    cols = ['lineNum', 'conStart1', 'conEnd1', 'conType1',
+            'conStart2', 'conEnd2', 'conType2']
+    for n, s1, e1, t1, s2, e2, t2 in X[cols].values:
+      a, b = (s1, e1, t1), (s2, e2, t2)
+      if int(s2) < int(s1):
+        a, b = b, a
+      rows.append((trees[int(n) - 1],
+                   int(a[0]), int(a[1]), a[2], int(b[0]), int(b[1]), b[2]))
+
+    index, s = timed(lambda: [tree.indexSpans(r[0]) for r in rows])
+    add('tree.indexSpans', s, len(rows))
+    _, s = timed(lambda: [tree.spt(r[0], r[1], r[5], i)
+                          for r, i in zip(rows, index)])
+    add('tree.spt', s, len(rows))
+    _, s = timed(lambda: [tree.insert(*(r + (i,)))
+                          for r, i in zip(rows, index)])
+    add('tree.insert', s, len(rows))
+    _, s = timed(lambda: [tree.suffix(*(r + (i,)))
+                          for r, i in zip(rows, index)])
+    add('tree.suffix', s, len(rows))
+  return out
+
+# Directories of models that runs only read, linked rather than copied.
+_LINKED = ['berkeleyparser', 'svm-light-TK-1.2.1']
+
+def sandbox(model):
+  """
+    Copies clirel and the model directory to a new temporary directory,
+    laid out as this tree, so that runs train and predict there. Returns
+    the directory, and the paths of clirel.py and of the model in it.
+    >>> d, clirel, m = sandbox(absPath('../model/infrandom'))
+    >>> sorted(os.listdir(d)), os.path.relpath(m, d)
+    (['model', 'predictions', 'src'], 'model/infrandom')
+    >>> shutil.rmtree(d)
+  """
+  d = tempfile.mkdtemp()
+  shutil.copytree(absPath('../src'), os.path.join(d, 'src'),
+                  ignore=shutil.ignore_patterns('*.pyc'))
+  out = os.path.join(d, 'model', os.path.basename(model))
+  shutil.copytree(model, out,
+                  ignore=shutil.ignore_patterns('*.pyc', *_LINKED))
+  for name in _LINKED:
+    if os.path.exists(os.path.join(model, name)):
+      os.symlink(os.path.join(model, name), os.path.join(out, name))
+  os.mkdir(os.path.join(d, 'predictions'))
+  return d, os.path.join(d, 'src', 'clirel.py'), out
+
+def commands(corpus, model):
+  """
+    Times clirel train, test and eval on the corpus, with a copy of the
+    model (see sandbox). Returns a dict of command: {'seconds', 'status',
+    'report'}, where report holds the stage timings clirel wrote (see
+    instrument.py).
+  """
+  reports = tempfile.mkdtemp()
+  env = dict(os.environ, CLIREL_REPORTS=reports)
+  d, clirel, model = sandbox(model)
+  clirel = [sys.executable, clirel]
+  parse = os.path.join(corpus, 'parse')
+  runs = [('train', clirel + ['train', corpus, model, parse]),
+          ('test',  clirel + ['test',  corpus, model, parse]),
+          ('eval',  clirel + ['eval',  corpus,
+                              os.path.join(d, 'predictions')])]
+
+  out = dict()
+  try:
+    for name, cmd in runs:
+      with open(os.devnull, 'w') as null:
+        status, s = timed(lambda: subprocess.call(cmd, stdout=null,
+                                                  stderr=subprocess.STDOUT,
+                                                  env=env))
+      out[name] = {'seconds': s, 'status': status, 'report': None}
+      report = os.path.join(reports, name + '.json')
+      if os.path.exists(report):
+        with open(report, 'r') as f:
+          out[name]['report'] = json.load(f)
+  finally:
+    shutil.rmtree(reports)
+    shutil.rmtree(d)
+  return out
+
+def revision():
+  """ The git commit of the tree being measured, if known. """
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                   cwd=absPath('.')).strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def run(sizes, model, keep=None, **opts):
+  """
+    Benchmarks corpora of each size (number of documents). Other options
+    are given to synth.generate.
+  """
+  results = list()
+  for n in sizes:
+    corpus = os.path.join(keep, str(n)) if keep else tempfile.mkdtemp()
+    try:
+      print "Generating %d documents..." % n
+      (nCons, nRels), s = timed(lambda: synth.generate(corpus, docs=n,
+                                                       **opts))
+      print "Timing stages..."
+      result = {'docs': n, 'concepts': nCons, 'relations': nRels,
+                'generate': s, 'stages': stages(corpus)}
+      print "Timing clirel..."
+      result['commands'] = commands(corpus, model)
+      results.append(result)
+    finally:
+      if not keep:
+        shutil.rmtree(corpus)
+
+  return {'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          'revision': revision(),
+          'python': platform.python_version(),
+          'model': model,
+          'options': opts,
+          'results': results}
+
+if __name__ == '__main__':
+  try:
+    flags, args = getopt.gnu_getopt(sys.argv[1:], '',
+                                    ['sizes=', 'model=', 'out=', 'keep=',
+                                     'cache'] +
+                                    [k + '=' for k in synth._DEFAULTS
+                                             if k != 'docs'])
+  except getopt.GetoptError:
+    print "USAGE: python run.py [--sizes 10,100,1000] [--model DIR]"
+    print "                     [--out FILE] [--keep DIR] [--cache]"
+    sys.exit(1)
+
+  sizes = [10, 100, 1000]
+  model = absPath('../model/kim')
+  out   = absPath('results/%s.json' % time.strftime('%Y%m%d-%H%M%S'))
+  keep  = None
+  opts  = dict()
+  cache = False
+  for o, v in flags:
+    if o == '--sizes':
+      sizes = [int(n) for n in v.split(',')]
+    elif o == '--model':
+      model = os.path.abspath(v)
+    elif o == '--out':
+      out = v
+    elif o == '--keep':
+      keep = v
+    elif o == '--cache':
+      cache = True
+    else:
+      opts[o[2:]] = int(v)
+
+  if not cache:
+    os.environ['CLIREL_CACHE'] = ''
+  else:
+    # The cache of this tree, not of the copy clirel runs from.
+    os.environ.setdefault('CLIREL_CACHE', absPath('../cache'))
+
+  report = run(sizes, model, keep, **opts)
+
+  if os.path.dirname(out) and not os.path.isdir(os.path.dirname(out)):
+    os.makedirs(os.path.dirname(out))
+  with open(out, 'w') as f:
+    json.dump(report, f, indent=2, sort_keys=True)
+  print "Results written to %s" % out
@@ -0,0 +1,170 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : synth.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Generates synthetic corpora in the i2b2 layout (concept, txt,
+           rel and parse directories, as in data/i2b2_examples), of any
+           size, to measure how the pipeline scales.
+           The text is random words, so only the amounts (documents, lines,
+           words, concepts, tree depth) are meaningful, not the results.
+
+           python synth.py <out_dir> [--docs N] [--lines N] [--words N]
+                                     [--concepts N] [--depth N] [--seed N]
+
+"""
+
+import os
+import sys
+import random
+import getopt
+
+# Relations between concept types, as (first type, second type): labels.
+_RELATIONS = {('treatment', 'problem'): ['TrIP', 'TrWP', 'TrCP', 'TrAP',
+                                         'TrNAP'],
+              ('test', 'problem'):      ['TeRP', 'TeCP'],
+              ('problem', 'problem'):   ['PIP']}
+
+_TYPES  = ['test', 'treatment', 'problem']
+_PHRASE = ['NP', 'VP', 'PP', 'S', 'SBAR', 'ADJP']
+_POS    = ['NN', 'NNS', 'DT', 'JJ', 'VBZ', 'VBN', 'IN', 'RB']
+
+_DEFAULTS = {'docs': 10, 'lines': 20, 'words': 12, 'concepts': 3,
+             'depth': 4, 'seed': 0}
+
+def sentence(rng, words):
+  """
+    Returns a list of random words.
+  """
+  return ['w%d' % rng.randint(0, 5000) for i in range(words)]
+
+def concepts(rng, words, n):
+  """
+    Returns up to n concepts, (start, end, type), that don't overlap, in the
+    order they appear. Concepts are one to three words long.
+    >>> concepts(random.Random(1), 12, 3)
+    [(1, 3, 'problem'), (5, 6, 'treatment'), (9, 11, 'test')]
+  """
+  out = list()
+  free = range(words)
+  for i in range(n):
+    if not free:
+      break
+    start = rng.choice(free)
+    end = start
+    for j in range(rng.randint(0, 2)):
+      if end + 1 in free:
+        end += 1
+    for k in range(start, end + 1):
+      free.remove(k)
+    out.append((start, end, rng.choice(_TYPES)))
+  out.sort()
+  return out
+
+def parseTree(rng, tokens, depth):
+  """
+    Returns a random bracketed tree over the tokens, no deeper than depth
+    phrases, as written by the parser.
+    >>> parseTree(random.Random(0), ['a', 'b', 'c'], 2)
+    '( (S (DT a) (VBZ b) (JJ c)) )'
+  """
+  return '( %s )' % _tree(rng, tokens, depth, 'S')
+
+def _tree(rng, tokens, depth, label):
+  """
+    Helper for parseTree.
+  """
+  if depth <= 1 or len(tokens) < 2:
+    return '(%s %s)' % (label, ' '.join('(%s %s)' % (rng.choice(_POS), t)
+                                        for t in tokens))
+  # Split the tokens into two to four phrases or words.
+  cuts = sorted(rng.sample(range(1, len(tokens)),
+                           min(len(tokens) - 1, rng.randint(1, 3))))
+  parts = [tokens[i:j] for i, j in zip([0] + cuts, cuts + [len(tokens)])]
+  out = list()
+  for p in parts:
+    if len(p) == 1:
+      out.append('(%s %s)' % (rng.choice(_POS), p[0]))
+    else:
+      out.append(_tree(rng, p, depth - 1, rng.choice(_PHRASE)))
+  return '(%s %s)' % (label, ' '.join(out))
+
+def document(rng, opts):
+  """
+    Returns the concept, text, relation and parse lines of a document.
+  """
+  cons = list()
+  txts = list()
+  rels = list()
+  pars = list()
+  for n in range(1, opts['lines'] + 1):
+    tokens = sentence(rng, opts['words'])
+    found = concepts(rng, opts['words'], opts['concepts'])
+    txts.append(' '.join(tokens))
+    pars.append(parseTree(rng, tokens, opts['depth']))
+
+    for s, e, t in found:
+      cons.append('c="%s" %d:%d %d:%d||t="%s"' % (' '.join(tokens[s:e + 1]),
+                                                 n, s, n, e, t))
+
+    # Annotate about half of the concept pairs that may be related.
+    for i, a in enumerate(found):
+      for b in found[i + 1:]:
+        for first, second in [(a, b), (b, a)]:
+          labels = _RELATIONS.get((first[2], second[2]))
+          if labels:
+            break
+        if not labels or rng.random() < 0.5:
+          continue
+        rels.append('c="%s" %d:%d %d:%d||r="%s"||c="%s" %d:%d %d:%d' % (
+                    ' '.join(tokens[first[0]:first[1] + 1]),
+                    n, first[0], n, first[1],
+                    rng.choice(labels),
+                    ' '.join(tokens[second[0]:second[1] + 1]),
+                    n, second[0], n, second[1]))
+  return cons, txts, rels, pars
+
+def generate(out_dir, **opts):
+  """
+    Writes a corpus to out_dir. Options (see _DEFAULTS) are the number of
+    documents, lines per document, words per line, concepts per line, the
+    depth of parse trees and the random seed.
+    Returns the number of concepts and relations written.
+  """
+  opts = dict(_DEFAULTS, **opts)
+  rng = random.Random(opts['seed'])
+
+  dirs = [('concept', 'con'), ('txt', 'txt'), ('rel', 'rel'),
+          ('parse', 'parse')]
+  for d, ext in dirs:
+    if not os.path.isdir(os.path.join(out_dir, d)):
+      os.makedirs(os.path.join(out_dir, d))
+
+  nCons = 0
+  nRels = 0
+  for i in range(opts['docs']):
+    name = 'synth%06d' % i
+    doc = document(rng, opts)
+    nCons += len(doc[0])
+    nRels += len(doc[2])
+    for (d, ext), lines in zip(dirs, doc):
+      with open(os.path.join(out_dir, d, '%s.%s' % (name, ext)), 'w') as f:
+        for line in lines:
+          f.write(line + '\n')
+  return nCons, nRels
+
+if __name__ == '__main__':
+  try:
+    flags, args = getopt.gnu_getopt(sys.argv[1:], '',
+                                    [k + '=' for k in _DEFAULTS])
+    opts = dict((o[2:], int(v)) for o, v in flags)
+    out_dir = args[0]
+  except (getopt.GetoptError, ValueError, IndexError):
+    print "USAGE: python synth.py out_dir [--docs N] [--lines N] [--words N]"
+    print "                               [--concepts N] [--depth N] [--seed N]"
+    sys.exit(1)
+  print "Wrote %d concepts and %d relations." % generate(out_dir, **opts)
@@ -11,15 +11,62 @@
            data is assumed to have already been parsed with the parsing script,
            and saved to a specified location. This script will extract the 
            parses from that file.
+           If a parse file is missing, the text is parsed first, with parses
+           taken from the parse cache where possible (see bServer.py).
+           Parse files are named by document, so one may be of an earlier
+           text of its document (i.e. a streamed document that changed, or
+           a document sent to the server under the name of another): the
+           text is then parsed again, and the parse file left as it is.
 
 """
 
 import os
+import re
 from pandas import DataFrame
 
-def extractPars(parFile):
+# Leaves of a parse tree, the tokens right before a closing parenthesis.
+_LEAF = re.compile(r'[^\s()]+(?=\))')
+
+# Tokens the parser writes escaped.
+_ESCAPES = {'-LRB-': '(', '-RRB-': ')', '-LSB-': '[', '-RSB-': ']',
+            '-LCB-': '{', '-RCB-': '}', '\\"': '"'}
+
+def _tokens(tokens):
+  return [_ESCAPES.get(t, t) for t in tokens]
+
+def current(parFile, txtFile):
   """
-    Takes a parse file and returns a panda datatable.
+    True if parFile holds the parses of the lines of txtFile as it is: the
+    leaves of each tree are the tokens of its line. Lines the parser
+    failed on can't be compared, and are taken as current.
+    >>> current('../i2b2_examples/parse/health.parse',
+    ...         '../i2b2_examples/txt/health.txt')
+    True
+    >>> import tempfile
+    >>> t = tempfile.NamedTemporaryFile(suffix='.txt')
+    >>> t.write(open('../i2b2_examples/txt/health.txt').read().replace(
+    ...   'improves', 'helps'))
+    >>> t.flush()
+    >>> current('../i2b2_examples/parse/health.parse', t.name)
+    False
+  """
+  with open(parFile, 'r') as f:
+    parses = f.readlines()
+  with open(txtFile, 'r') as f:
+    lines = f.readlines()
+  if len(parses) != len(lines):
+    return False
+  for p, l in zip(parses, lines):
+    leaves = _LEAF.findall(p)
+    if leaves and _tokens(leaves) != _tokens(l.split()):
+      return False
+  return True
+
+def extractPars(parFile, txtFile=None):
+  """
+    Takes a parse file and returns a panda datatable. If the parse file does
+    not exist, it is created from txtFile. If it isn't the parse of txtFile
+    as it is (see current), txtFile is parsed again instead.
     >>> print extractPars('../i2b2_examples/parse/health.parse').ix[0]
     lineNum                                                     1
     parse       (S (NP (DT This) (NN treatment)) (VP (VBZ impr...
@@ -31,11 +78,22 @@ def extractPars(parFile):
     fileName                                               health
     Name: 1, dtype: object
   """
-  data = list()
+  if txtFile != None and not os.path.exists(parFile):
+    import bServer
+    bServer.parseFile(bServer.shared(), txtFile, parFile)
 
-  with open(parFile, 'r') as f:
-    for i, line in enumerate(f):
-      data.append((i+1, line.strip()[2:-2]))
+  if txtFile != None and not current(parFile, txtFile):
+    # Unchanged sentences are taken from the parse cache.
+    import bServer
+    with open(txtFile, 'r') as f:
+      lines = bServer.shared().parse(f.readlines())
+  else:
+    with open(parFile, 'r') as f:
+      lines = f.readlines()
+
+  data = list()
+  for i, line in enumerate(lines):
+    data.append((i+1, line.strip()[2:-2]))
   
   out = DataFrame(data, columns = ["lineNum", 
                                    "parse"])
@@ -0,0 +1,182 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : bServer.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Keeps one BerkeleyParser running and sends it sentences over a
+           pipe, so the JVM is started and the grammar loaded only once.
+           The parser writes one tree per input line, and flushes after
+           each, so trees are read back in the order the sentences were
+           sent.
+
+           Parses are kept in a cache (see parseCache.py), and the parser is
+           only started once a sentence is not found there.
+
+           Run as a script to parse text files into parse files, as
+           parse_texts.sh does:
+             python bServer.py <txt file or directory>
+
+"""
+
+import os
+import sys
+import atexit
+import threading
+import subprocess
+
+import parseCache
+
+def absPath(path):
+  """ Return absolute path from where this file is located """
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+_JAR     = absPath('./berkeleyparser/BerkeleyParser-1.7.jar')
+_GRAMMAR = absPath('./berkeleyparser/eng_sm6.gr')
+_CACHE   = absPath('../../cache/parses.db')
+
+class Parser(object):
+  """
+    A BerkeleyParser, started when first needed. Use parse() to parse
+    batches of sentences, and close() (or a with statement) to stop it.
+    Parses are looked up in, and added to, cache (a parseCache.ParseCache)
+    if one is given.
+  """
+
+  def __init__(self, jar=_JAR, grammar=_GRAMMAR, java='java', cache=None):
+    self.cmd     = [java, '-jar', jar, '-gr', grammar]
+    self.grammar = grammar
+    self.cache   = cache
+    self.proc    = None
+
+  def parse(self, sentences):
+    """
+      Returns the parse tree of each sentence, in order, as written by the
+      parser (i.e. '( (S ...) )', or '(())' if it failed).
+    """
+    if self.cache == None:
+      return self._parse(sentences)
+
+    out = self.cache.get(sentences)
+    miss = [i for i, t in enumerate(out) if t == None]
+    if miss:
+      # Parse each unseen sentence once, even if it repeats.
+      unseen = list(set(' '.join(sentences[i].split()) for i in miss))
+      trees  = dict(zip(unseen, self._parse(unseen)))
+      self.cache.put(unseen, [trees[s] for s in unseen])
+      for i in miss:
+        out[i] = trees[' '.join(sentences[i].split())]
+    return out
+
+  def _parse(self, sentences):
+    """
+      Helper for parse, sends the sentences to the parser.
+    """
+    if not sentences:
+      return list()
+    if self.proc == None:
+      self.proc = subprocess.Popen(self.cmd,
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE)
+
+    sentences = [' '.join(s.split()) + '\n' for s in sentences]
+
+    # Write from another thread, the parser blocks once the output pipe is
+    # full, and would never read the rest of a large batch.
+    writer = threading.Thread(target=self._write, args=(sentences,))
+    writer.daemon = True
+    writer.start()
+
+    out = list()
+    for i in range(len(sentences)):
+      line = self.proc.stdout.readline()
+      if line == '':
+        raise IOError('BerkeleyParser stopped (exit status %s).' %
+                      self.proc.poll())
+      out.append(line.rstrip('\n'))
+
+    writer.join()
+    return out
+
+  def _write(self, sentences):
+    try:
+      self.proc.stdin.writelines(sentences)
+      self.proc.stdin.flush()
+    except IOError:
+      # Parser stopped, parse() reports it.
+      pass
+
+  def close(self):
+    if self.proc != None and self.proc.poll() == None:
+      self.proc.stdin.close()
+      self.proc.wait()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *args):
+    self.close()
+
+# Parser shared by the callers of this process, see shared().
+_shared = None
+
+def shared():
+  """
+    Returns a Parser, with the parse cache, kept for the life of the
+    process, so documents parsed one at a time (see bParser.extractPars)
+    start at most one parser.
+  """
+  global _shared
+  if _shared == None:
+    _shared = Parser(cache=parseCache.ParseCache(_CACHE, _GRAMMAR))
+    atexit.register(_shared.close)
+  return _shared
+
+def parseFile(parser, txtFile, parFile):
+  """
+    Parses each line of a text file into a line of the parse file.
+  """
+  with open(txtFile, 'r') as f:
+    lines = f.readlines()
+
+  trees = parser.parse(lines)
+
+  with open(parFile, 'w') as f:
+    for t in trees:
+      f.write(t + '\n')
+
+def parseTexts(path, parser=None):
+  """
+    Parses a text file, or every text file of a directory, into the parse
+    directory next to it (path/../parse), with one parser.
+  """
+  if os.path.isdir(path):
+    txts = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    p_dir = os.path.join(path, '..', 'parse')
+  else:
+    txts = [path]
+    p_dir = os.path.join(os.path.dirname(path), '..', 'parse')
+
+  own = parser == None
+  if own:
+    parser = Parser(cache=parseCache.ParseCache(_CACHE, _GRAMMAR))
+  try:
+    for t in txts:
+      print "Parsing %s" % t
+      name = os.path.basename(t).split('.')[0]
+      parseFile(parser, t, os.path.join(p_dir, name + '.parse'))
+  finally:
+    if own:
+      parser.close()
+  if parser.cache != None:
+    print parser.cache.stats()
+
+if __name__ == '__main__':
+  if len(sys.argv) < 2:
+    print "USAGE: python bServer.py <txt file or directory>"
+    sys.exit(1)
+  print "Running Parser..."
+  parseTexts(sys.argv[1])
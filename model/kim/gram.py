@@ -0,0 +1,181 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : gram.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Gram matrix of the training instances under the composite
+           kernel (see kernel.py), in a memory mapped file. Rows are
+           computed the first time a trainer needs them and kept, so the
+           svms of all labels, which share the same instances, compute each
+           kernel value once. The matrix is kept between runs, by the
+           instances and kernel options, in a directory of at most maxSize
+           bytes: the least recently used matrices are removed first.
+           A matrix larger than maxSize isn't kept: only the most recently
+           used rows that fit in maxSize are, in memory.
+
+"""
+
+import os
+import sys
+import hashlib
+import numpy as np
+from collections import OrderedDict
+
+import kernel
+
+class Gram(object):
+  """
+    The kernel values of the instance lines, computed a row at a time.
+    >>> import tempfile, shutil
+    >>> d = tempfile.mkdtemp()
+    >>> lines = ['|BT| (NP (DT a) (NN test)) |ET| 2:1 6:1 |EV|',
+    ...          '|BT| (NP (DT the) (NN test)) |ET| 2:1 6:1 |EV|',
+    ...          '|BT| (VP (VB is)) |ET| 3:1 6:1 |EV|']
+    >>> g = Gram(d, lines, kernel.readOptions(['-C', 'T']))
+    >>> ['%.4f' % v for v in g.row(0)]
+    ['1.0000', '0.6061', '0.0000']
+    >>> '%.4f' % g.row(1)[0], g.computed
+    ('0.6061', 2)
+    >>> g.close()
+    >>> Gram(d, lines, kernel.readOptions(['-C', 'T'])).done.sum()
+    2
+
+    Over maxSize, rows are kept in memory, the stored matrices are left.
+    >>> g = Gram(d, lines, kernel.readOptions(['-C', 'T']), maxSize=30)
+    >>> ['%.4f' % g.row(i)[1] for i in (0, 1, 2)], g.computed, len(g.rows)
+    (['0.6061', '1.0000', '0.0000'], 3, 2)
+    >>> '%.4f' % g.row(0)[1], g.computed
+    ('0.6061', 4)
+    >>> len(os.listdir(d))
+    2
+    >>> shutil.rmtree(d)
+  """
+
+  def __init__(self, path, lines, opts=None, maxSize=2**32):
+    self.kernel = kernel.Kernel(opts)
+    self.x = [self.kernel.prepare(kernel.Instance(l)) for l in lines]
+    n = len(lines)
+
+    h = hashlib.sha1(repr(sorted(self.kernel.opts.items())))
+    for l in lines:
+      h.update(l)
+    self.name = os.path.join(path, h.hexdigest())
+
+    # Rows computed by this process, and rows read.
+    self.computed = 0
+    self.reads    = 0
+    self._diagonal = None
+
+    if n * n * 4 + n > maxSize:
+      # The matrix doesn't fit, keep the rows that do, least recently used
+      # first out (smo uses two rows at a time).
+      self.K    = None
+      self.rows = OrderedDict()
+      self.maxRows = max(2, maxSize // (4 * n))
+      return
+
+    if not os.path.isdir(path):
+      os.makedirs(path)
+    exists = all(os.path.exists(self.name + ext) for ext in ('.gram', '.rows'))
+    evict(path, maxSize - n * n * 4 - n, keep=self.name if exists else None)
+    mode = 'r+' if exists else 'w+'
+    self.K    = np.memmap(self.name + '.gram', np.float32, mode,
+                          shape=(max(n, 1), max(n, 1)))
+    self.done = np.memmap(self.name + '.rows', np.bool_, mode,
+                          shape=(max(n, 1),))
+    for ext in ('.gram', '.rows'):
+      os.utime(self.name + ext, None)
+
+  def __len__(self):
+    return len(self.x)
+
+  def row(self, i):
+    """ The kernel values of instance i and every instance. """
+    self.reads += 1
+    if self.K is None:
+      return self._lruRow(i)
+    if not self.done[i]:
+      # Imported here, as src is only on the path once model.py is loaded.
+      import instrument
+      with instrument.stage('kernel') as s:
+        r = np.empty(len(self.x), dtype=np.float32)
+        # The values of rows already computed are in their columns.
+        known = np.flatnonzero(self.done[:len(self.x)])
+        r[known] = self.K[known, i]
+        for j in np.flatnonzero(~self.done[:len(self.x)]):
+          r[j] = self.kernel.kernel(self.x[i], self.x[j])
+        s.rows += len(self.x) - len(known)
+      self.K[i] = r
+      self.done[i] = True
+      self.computed += 1
+    return np.array(self.K[i, :len(self.x)], dtype=np.float64)
+
+  def _lruRow(self, i):
+    """ Helper for row, when the rows are kept in memory. """
+    if i in self.rows:
+      r = self.rows.pop(i)
+    else:
+      import instrument
+      with instrument.stage('kernel') as s:
+        r = np.empty(len(self.x), dtype=np.float32)
+        for j in xrange(len(self.x)):
+          # The values of rows kept are in their columns.
+          r[j] = (self.rows[j][i] if j in self.rows else
+                  self.kernel.kernel(self.x[i], self.x[j]))
+        s.rows += len(self.x) - len(self.rows)
+      self.computed += 1
+      while len(self.rows) >= self.maxRows:
+        self.rows.popitem(last=False)
+    self.rows[i] = r
+    return np.array(r, dtype=np.float64)
+
+  def diagonal(self):
+    """ The kernel value of each instance with itself. """
+    if self._diagonal is None and self.K is None:
+      self._diagonal = np.array([self.kernel.kernel(x, x) for x in self.x])
+    if self._diagonal is None:
+      self._diagonal = np.array([self.K[i, i] if self.done[i] else
+                                 self.kernel.kernel(x, x)
+                                 for i, x in enumerate(self.x)])
+    return self._diagonal
+
+  def close(self):
+    if self.K is None:
+      self.rows.clear()
+      return
+    self.K.flush()
+    self.done.flush()
+    del self.K
+    del self.done
+
+def evict(path, maxSize, keep=None):
+  """
+    Removes the least recently used matrices of path, other than keep,
+    until the rest take at most maxSize bytes.
+  """
+  names = dict()
+  for f in os.listdir(path):
+    name, ext = os.path.splitext(os.path.join(path, f))
+    if ext in ('.gram', '.rows') and name != keep:
+      st = os.stat(name + ext)
+      size, used = names.get(name, (0, 0))
+      names[name] = (size + st.st_size, max(used, st.st_mtime))
+
+  total = sum(size for size, used in names.values())
+  for name in sorted(names, key=lambda n: names[n][1]):
+    if total <= maxSize:
+      break
+    for ext in ('.gram', '.rows'):
+      if os.path.exists(name + ext):
+        os.remove(name + ext)
+    total -= names[name][0]
+
+if __name__ == '__main__':
+  sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '../../src'))
+  import doctest
+  doctest.testmod()
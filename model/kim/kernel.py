@@ -0,0 +1,309 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : kernel.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : In-process scoring with the models learnt by svm-light-TK.
+           Implements the composite kernel the kim model is trained with
+           (svm_learn -t 5): a convolution tree kernel over the |BT| trees
+           and a standard kernel over the entity vectors, each normalized
+           and then combined.
+           The tree kernel is the subset tree kernel of Collins and Duffy
+           (-D 1), or the subtree kernel (-D 0), with decay factor -L.
+
+"""
+
+import os
+import math
+from collections import defaultdict
+
+import tree
+
+# Defaults of svm_learn, used for options the model file doesn't give.
+_DEFAULTS = {'t': 5,     # kernel type
+             'd': 3,     # polynomial degree
+             'g': 1.0,   # rbf gamma
+             's': 1.0,   # polynomial / sigmoid scale
+             'r': 1.0,   # polynomial / sigmoid constant
+             'L': 0.4,   # tree kernel decay factor
+             'T': 1.0,   # weight of the tree kernel
+             'C': 'T',   # combination of the tree and vector kernels
+             'D': 1,     # 0 subtree kernel, 1 subset tree kernel
+             'S': 1,     # kernel used on the vectors
+             'N': 3}     # 0 none, 1 tree, 2 vector, 3 both normalized
+
+class Tree(object):
+  """
+    A parse tree prepared for the tree kernel: its nodes are numbered and
+    grouped by production, so only nodes with equal productions are
+    compared.
+    >>> t = Tree(tree.createTree('(NP (DT a) (NN test))'))
+    >>> t.prods
+    ['DT a', 'NN test', 'NP DT NN']
+    >>> t.children
+    [[], [], [0, 1]]
+    >>> Tree(tree.createTree('( (NP (DT a) (NN test)) )')).prods[-1]
+    ' NP'
+  """
+  __slots__ = ('prods', 'children', 'nodes')
+
+  def __init__(self, t):
+    self.prods    = list()
+    self.children = list()
+    self.nodes    = defaultdict(list)
+    if len(t) > 0:
+      self._add(t)
+
+  def _add(self, t):
+    # A node without a label (i.e. the root wrapping the trees of
+    # predictions) is still a node to svm-light-TK, labeled ''.
+    label, rest = (t[0], t[1:]) if type(t[0]) == str else ('', t)
+    children = [self._add(c) for c in rest if type(c) != str]
+    prod = ' '.join([label] + [c if type(c) == str else _label(c)
+                               for c in rest])
+
+    i = len(self.prods)
+    self.prods.append(prod)
+    self.children.append(children)
+    self.nodes[prod].append(i)
+    return i
+
+def _label(t):
+  return t[0] if type(t[0]) == str else ''
+
+def treeKernel(a, b, lam=0.4, sigma=1):
+  """
+    Sum over all pairs of nodes of the number of common tree fragments
+    rooted at them, each weighted by lam to the size of the fragment.
+    sigma is 1 for the subset tree kernel and 0 for the subtree kernel.
+    >>> a = Tree(tree.createTree('(NP (DT a) (NN test))'))
+    >>> '%.4f' % treeKernel(a, a)
+    '1.5840'
+    >>> '%.4f' % treeKernel(a, a, sigma=0)
+    '0.8640'
+    >>> b = Tree(tree.createTree('(NP (DT the) (NN test))'))
+    >>> '%.4f' % treeKernel(a, b)
+    '0.9600'
+  """
+  if len(a.nodes) > len(b.nodes):
+    a, b = b, a
+
+  memo = dict()
+  out = 0.0
+  for prod, nodes in a.nodes.iteritems():
+    if prod not in b.nodes:
+      continue
+    for i in nodes:
+      for j in b.nodes[prod]:
+        out += _delta(a, b, i, j, lam, sigma, memo)
+  return out
+
+def _delta(a, b, i, j, lam, sigma, memo):
+  """
+    Helper for treeKernel, the weighted number of common fragments rooted
+    at node i of a and node j of b.
+  """
+  if (i, j) in memo:
+    return memo[(i, j)]
+
+  if a.prods[i] != b.prods[j]:
+    out = 0.0
+  else:
+    out = lam
+    for ci, cj in zip(a.children[i], b.children[j]):
+      out *= sigma + _delta(a, b, ci, cj, lam, sigma, memo)
+
+  memo[(i, j)] = out
+  return out
+
+def vectorKernel(a, b, opts):
+  """
+    Kernel between two sparse vectors, as selected by -S.
+    >>> vectorKernel({2: 1.0, 6: 1.0}, {2: 1.0, 5: 1.0}, dict(_DEFAULTS, S=1, d=2))
+    4.0
+  """
+  dot = sum(v * b[k] for k, v in a.iteritems() if k in b)
+  kind = int(opts['S'])
+  if kind == 0:
+    return dot
+  if kind == 1:
+    return (opts['s'] * dot + opts['r']) ** int(opts['d'])
+  if kind == 2:
+    dist = sum((a.get(k, 0.0) - b.get(k, 0.0)) ** 2 for k in set(a) | set(b))
+    return math.exp(-opts['g'] * dist)
+  if kind == 3:
+    return math.tanh(opts['s'] * dot + opts['r'])
+  raise ValueError('Unsupported vector kernel: -S %s' % opts['S'])
+
+class Instance(object):
+  """
+    A line of svm-light-TK input: an optional target or weight, a tree
+    between |BT| and |ET|, and a vector between |ET| and |EV|.
+    >>> x = Instance('-1 |BT| (NP (DT a) (NN test)) |ET| 2:1 6:1 |EV|')
+    >>> x.target, x.tree.prods[-1], sorted(x.vec.items())
+    (-1.0, 'NP DT NN', [(2, 1.0), (6, 1.0)])
+  """
+  __slots__ = ('target', 'tree', 'vec', 'norms')
+
+  def __init__(self, line):
+    head, rest = line.split('|BT|', 1)
+    t, rest    = rest.split('|ET|', 1)
+    v          = rest.split('|EV|', 1)[0]
+
+    head = head.strip()
+    self.target = float(head) if head else None
+    self.tree   = Tree(tree.createTree(t.strip()))
+    self.vec    = dict()
+    for feat in v.split():
+      k, val = feat.split(':')
+      self.vec[int(k)] = float(val)
+    self.norms  = None
+
+def option(k, value):
+  """
+    Converts the value of option k to the type of its default. Model files
+    write some integer options as floats. Options without a default are
+    kept as strings.
+    >>> option('D', '1.000000'), option('T', '3.35'), option('W', 'S')
+    (1, 3.35, 'S')
+  """
+  if type(_DEFAULTS.get(k)) == int:
+    return int(float(value))
+  if type(_DEFAULTS.get(k)) == float:
+    return float(value)
+  return value
+
+def readOptions(args):
+  """
+    Reads svm_learn style options.
+    >>> sorted(readOptions(['-t', '5', '-T', '3.35', '-C', '+']).items())
+    [('C', '+'), ('T', 3.35), ('t', 5)]
+  """
+  out = dict()
+  for flag, value in zip(args[::2], args[1::2]):
+    k = flag.lstrip('-')
+    out[k] = option(k, value)
+  return out
+
+class Kernel(object):
+  """
+    The composite kernel of svm-light-TK (-t 5), with the options opts
+    (svm_learn style, see readOptions) or the svm_learn defaults.
+    Instances are prepared once, then compared any number of times.
+    >>> k = Kernel(readOptions(['-C', '+', '-T', '2']))
+    >>> a = k.prepare(Instance('|BT| (NP (DT a) (NN test)) |ET| 2:1 6:1 |EV|'))
+    >>> b = k.prepare(Instance('|BT| (NP (DT the) (NN test)) |ET| 2:1 |EV|'))
+    >>> '%.4f %.4f' % (k.kernel(a, a), k.kernel(a, b))
+    '3.0000 1.7565'
+  """
+
+  def __init__(self, opts=None):
+    self.opts = dict(_DEFAULTS)
+    if opts:
+      self.opts.update(opts)
+
+  def prepare(self, x):
+    """ Computes the self kernels of x, used for normalization. """
+    x.norms = (treeKernel(x.tree, x.tree, self.opts['L'], int(self.opts['D'])),
+               vectorKernel(x.vec, x.vec, self.opts))
+    return x
+
+  def kernel(self, a, b):
+    """ The composite kernel between two prepared instances. """
+    o = self.opts
+    norm = int(o['N'])
+
+    kt = treeKernel(a.tree, b.tree, o['L'], int(o['D']))
+    if norm in (1, 3):
+      d = (a.norms[0] * b.norms[0]) ** 0.5
+      kt = kt / d if d > 0 else 0.0
+
+    kv = vectorKernel(a.vec, b.vec, o)
+    if norm in (2, 3):
+      d = (a.norms[1] * b.norms[1]) ** 0.5
+      kv = kv / d if d > 0 else 0.0
+
+    if o['C'] == '+':
+      return o['T'] * kt + kv
+    if o['C'] == '*':
+      return kt * kv
+    if o['C'] == 'T':
+      return kt
+    if o['C'] == 'V':
+      return kv
+    raise ValueError('Unsupported combination: -C %s' % o['C'])
+
+class Model(Kernel):
+  """
+    An svm-light-TK model file, scores instances the way svm_classify does:
+    the sum over support vectors of alpha * y * K(sv, x), minus b.
+    Options that are not kept in the model file are taken from opts
+    (svm_learn style, see readOptions), else from the svm_learn defaults.
+    >>> import tempfile
+    >>> f = tempfile.NamedTemporaryFile(suffix='.svm')
+    >>> f.write('\\n'.join(['SVM-light Version V6.01',
+    ...                     '5 # kernel type',
+    ...                     '2 # kernel parameter -d',
+    ...                     '0.5 # threshold b, each following line is a SV',
+    ...                     '1 |BT| (NP (DT a) (NN test)) |ET| 2:1 6:1 |EV|',
+    ...                     '-1 |BT| (NP (DT a) (NN cat)) |ET| 3:1 6:1 |EV|']))
+    >>> f.flush()
+    >>> m = Model(f.name, readOptions(['-C', '+', '-T', '3.35']))
+    >>> '%.4f' % m.score('|BT| ( (NP (DT a) (NN test)) ) |ET| 2:1 6:1 |EV|')
+    '1.1513'
+  """
+
+  def __init__(self, f_name, opts=None):
+    Kernel.__init__(self)
+    self.sv = list()
+
+    with open(f_name, 'r') as f:
+      f.readline()  # Version
+      for line in f:
+        value, _, comment = line.partition('#')
+        if 'threshold b' in comment:
+          self.b = float(value)
+          break
+        if 'kernel parameter' in comment:
+          k = comment.split('-')[-1].strip()
+          if k == 'u':
+            # Custom parameters may hold the tree kernel options.
+            self.opts.update(readOptions(value.split()))
+          elif value.strip():
+            self.opts[k] = option(k, value.strip())
+      for line in f:
+        if '|BT|' in line:
+          self.sv.append(Instance(line))
+
+    if opts:
+      self.opts.update(opts)
+    for sv in self.sv:
+      self.prepare(sv)
+
+  def score(self, line):
+    """
+      Returns the decision value of an instance line.
+    """
+    x = self.prepare(Instance(line))
+    return sum(sv.target * self.kernel(sv, x) for sv in self.sv) - self.b
+
+# Models loaded in this process, by file.
+_models = dict()
+
+def load(f_name, opts=None):
+  """
+    Returns the model in f_name, loading it once per process (and again if
+    the file changes).
+  """
+  key = (os.path.abspath(f_name), os.path.getmtime(f_name))
+  if key not in _models:
+    _models[key] = Model(f_name, opts)
+  return _models[key]
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod()
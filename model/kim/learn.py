@@ -0,0 +1,171 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : learn.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Trains svms in this process (kim's --engine python), as
+           svm_learn does but over a shared Gram matrix (see gram.py), so
+           the kernel values of the instances are computed once for all
+           labels instead of once per svm_learn run.
+           The dual problem is solved by SMO, with the working set
+           selection of LIBSVM (Fan et al., 2005), and models are written
+           in the format of svm-light-TK, for svm_classify or kernel.py.
+
+"""
+
+import os
+import numpy as np
+
+# Stands in for a non positive curvature.
+_TAU = 1e-12
+
+def smo(gram, y, C, eps=0.001, maxIter=None):
+  """
+    Solves the dual svm problem of the instances of gram with targets y
+    (1 or -1), under costs C (a number, or one per instance).
+    Returns alpha and b, so that the decision value of x is the sum over
+    instances of alpha * y * K(i, x), minus b (as in svm-light).
+    >>> class Linear(object):
+    ...   def __init__(self, X): self.X = np.array(X, dtype=float)
+    ...   def row(self, i): return self.X.dot(self.X[i])
+    ...   def diagonal(self): return (self.X ** 2).sum(axis=1)
+    >>> g = Linear([[0, 0], [1, 1], [2, 2], [3, 3]])
+    >>> alpha, b = smo(g, np.array([-1, -1, 1, 1]), 10.0)
+    >>> alpha.round(3).tolist(), round(b, 3)
+    ([0.0, 1.0, 1.0, 0.0], 3.0)
+  """
+  y = np.asarray(y, dtype=np.float64)
+  n = len(y)
+  C = np.zeros(n) + C
+  alpha = np.zeros(n)
+  G = -np.ones(n)
+  diag = gram.diagonal()
+
+  for it in xrange(maxIter or max(10000000, 100 * n)):
+    # Most violating pair: i from the instances whose alpha can grow along
+    # y, j the one that most decreases the objective with i.
+    yG  = -y * G
+    up  = ((y > 0) & (alpha < C)) | ((y < 0) & (alpha > 0))
+    low = ((y > 0) & (alpha > 0)) | ((y < 0) & (alpha < C))
+    if not up.any() or not low.any():
+      break
+    i = np.flatnonzero(up)[np.argmax(yG[up])]
+    if yG[i] - yG[low].min() < eps:
+      break
+
+    Ki = gram.row(i)
+    cand = np.flatnonzero(low & (yG < yG[i]))
+    quad = diag[i] + diag[cand] - 2 * Ki[cand]
+    quad[quad <= 0] = _TAU
+    j = cand[np.argmax((yG[i] - yG[cand]) ** 2 / quad)]
+    Kj = gram.row(j)
+
+    ai, aj = alpha[i], alpha[j]
+    if y[i] != y[j]:
+      quad = max(diag[i] + diag[j] - 2 * Ki[j], _TAU)
+      delta = (-G[i] - G[j]) / quad
+      diff = ai - aj
+      alpha[i] += delta
+      alpha[j] += delta
+      if diff > 0:
+        if alpha[j] < 0:
+          alpha[j], alpha[i] = 0, diff
+      elif alpha[i] < 0:
+        alpha[i], alpha[j] = 0, -diff
+      if diff > C[i] - C[j]:
+        if alpha[i] > C[i]:
+          alpha[i], alpha[j] = C[i], C[i] - diff
+      elif alpha[j] > C[j]:
+        alpha[j], alpha[i] = C[j], C[j] + diff
+    else:
+      quad = max(diag[i] + diag[j] - 2 * Ki[j], _TAU)
+      delta = (G[i] - G[j]) / quad
+      total = ai + aj
+      alpha[i] -= delta
+      alpha[j] += delta
+      if total > C[i]:
+        if alpha[i] > C[i]:
+          alpha[i], alpha[j] = C[i], total - C[i]
+      elif alpha[j] < 0:
+        alpha[j], alpha[i] = 0, total
+      if total > C[j]:
+        if alpha[j] > C[j]:
+          alpha[j], alpha[i] = C[j], total - C[j]
+      elif alpha[i] < 0:
+        alpha[i], alpha[j] = 0, total
+
+    G += y * (y[i] * Ki * (alpha[i] - ai) + y[j] * Kj * (alpha[j] - aj))
+
+  return alpha, threshold(y, alpha, G, C)
+
+def threshold(y, alpha, G, C):
+  """
+    Helper for smo, the b of a solution: the average over free instances,
+    or the middle of the feasible range if there are none.
+  """
+  yG = y * G
+  free = (alpha > 0) & (alpha < C)
+  if free.any():
+    return yG[free].mean()
+  atUpper = alpha >= C
+  lower = (atUpper & (y < 0)) | (~atUpper & (y > 0))
+  ub = yG[lower].min() if lower.any() else np.inf
+  lb = yG[~lower].max() if (~lower).any() else -np.inf
+  if np.isinf(ub) or np.isinf(lb):
+    return lb if np.isinf(ub) else ub
+  return (ub + lb) / 2
+
+# Options in the header of svm-light-TK models, with their formats.
+_HEADER = [('d', '%d'), ('g', '%.8g'), ('s', '%.8g'), ('r', '%.8g'),
+           ('u', '%s'), ('L', '%.8g'), ('T', '%.8g'), ('C', '%s'),
+           ('F', '%s'), ('S', '%d'), ('D', '%f'), ('N', '%d'), ('V', '%s'),
+           ('W', '%s')]
+
+def writeModel(f_name, opts, lines, alphaY, b):
+  """
+    Writes an svm-light-TK model: the kernel options opts (see
+    kernel.Kernel), the threshold b and each instance line with a non zero
+    alpha * y, as a support vector.
+  """
+  sv = np.flatnonzero(alphaY)
+  features = [int(f.split(':')[0]) for l in lines
+              for f in l.split('|ET|')[1].split('|EV|')[0].split()]
+  with open(f_name, 'w') as f:
+    f.write('SVM-light Version V5.01-TK-1.2\n')
+    f.write('%d # kernel type\n' % opts['t'])
+    for k, form in _HEADER:
+      value = opts.get(k, 'empty' if k == 'u' else 'S' if k in 'VW' else 1)
+      f.write((form % value) + '%s# kernel parameter -%s \n'
+              % ('' if value == 'empty' else ' ', k))
+    f.write('%d # highest feature index \n' % max(features + [0]))
+    f.write('%d # number of training documents \n' % len(lines))
+    f.write('%d # number of support vectors plus 1 \n' % (len(sv) + 1))
+    f.write('%.8g # threshold b, each following line is a SV (starting with '
+            'alpha*y)\n' % b)
+    for i in sv:
+      f.write('%.32g %s\n' % (alphaY[i], lines[i].strip()))
+
+def train(gram, lines, labels, names, opts, svm_dir):
+  """
+    Trains the svm of each label in names, one against the others, and
+    writes it to svm_dir/<label>.svm. labels holds the label of each
+    instance line, gram their Gram matrix. opts are the svm_learn options
+    (see kernel.readOptions): the cost -c (by default one over the average
+    of the diagonal, as svm_learn), the cost factor -j of positive
+    examples and the tolerance -e.
+  """
+  c = float(opts['c']) if 'c' in opts else 1.0 / gram.diagonal().mean()
+  for label in names:
+    y = np.where(labels == label, 1, -1)
+    C = np.where(y > 0, c * float(opts.get('j', 1)), c)
+    alpha, b = smo(gram, y, C, float(opts.get('e', 0.001)))
+    writeModel(os.path.join(svm_dir, label + '.svm'), gram.kernel.opts,
+               lines, alpha * y, b)
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod()
@@ -17,12 +17,18 @@
 """
 
 
+# kernel, gram, learn, scheduler and workqueue serve only some options, and
+# are imported by the functions that use them (see clirel.loadModel).
 import tree
 import bParser
 import numpy as np
 
 import os
 import sys
+import shutil
+import getopt
+import itertools
+import functools
 import subprocess
 import pandas as pd
 
@@ -36,10 +42,42 @@ _LABELS = ['TrIP','TrWP','TrCP',
            'TeCP','PIP', 'NTrP',
            'NTeP','NPP']
 
+# Gram matrices of training instances, for --engine python.
+_GRAM = absPath('../../cache/gram')
+
+# Concept type pairs that can have a relation, the others are left out
+# before features are extracted (see genNeg and note.Pruning).
+_TYPES = [('treatment', 'problem'),
+          ('test',      'problem'),
+          ('problem',   'problem')]
+
+# svm_learn options: composite kernel of the parse trees and entity vectors.
+_SVM_FLAGS = ['-t', '5',
+              '-S', '1',
+              '-D', '1',
+              '-r', '1',
+              '-c', '0.5',
+              '-d', '2',
+              '-T', '3.35',
+              '-N', '3',
+              '-W', 'S',
+              '-v', '0']
+
+# Stages run on each candidate pair, to estimate the time pruning saves.
+_PAIR_STAGES = ['loading', 'negatives', 'parse merge', 'enrichment',
+                'svm write']
+
+def relationKeys(l):
+  """
+    Returns the set of (lineNum, conStart1, conEnd1, conStart2, conEnd2)
+    of the entries, to look up labeled pairs.
+  """
+  return set(zip(l.lineNum, l.conStart1, l.conEnd1, l.conStart2, l.conEnd2))
 
 def genNeg(x, l=None):
   """
     Helper, generates negative examples.
+    l is the set of labeled pairs (see relationKeys).
     NTrP: No relationship between a treatment and a problem.
     NTeP: No relationship between a test and a problem.
     NPP:  No relationship between a problem and a problem.
@@ -63,11 +101,7 @@ def genNeg(x, l=None):
     nan
   """
   # Special case where other order does have a valid label.
-  if type(l) != type(None) and not l[(l.lineNum   ==  x.lineNum)  &
-                                     (l.conStart1 == x.conStart2) &
-                                     (l.conEnd1   == x.conEnd2)   &
-                                     (l.conStart2 == x.conStart1) &
-                                     (l.conEnd2   == x.conEnd1)   ].empty:
+  if l and (x.lineNum, x.conStart2, x.conEnd2, x.conStart1, x.conEnd1) in l:
     return x.relType
 
   # Special cases due to noisy training data
@@ -93,24 +127,63 @@ def genNeg(x, l=None):
 
   return x.relType
 
+def negLabels(X, l=None):
+  """
+    Generates negative examples for a whole table, as genNeg does per entry.
+    l is the set of labeled pairs (see relationKeys).
+    >>> list(negLabels(DataFrame([test1, test2, test3, test4, test5])))
+    ['NTrP', 'NPP', 'NTeP', 'TeIP', nan]
+    >>> list(negLabels(DataFrame([test6, test7, test8, test9])))
+    ['NTrP', 'NTeP', 'TeIP', nan]
+  """
+  t1, t2 = X['conType1'], X['conType2']
+  def pair(a, b):
+    return ((t1 == a) & (t2 == b)) | ((t1 == b) & (t2 == a))
+
+  out = X['relType'].astype(object)
+  unlabeled = out.isnull()
+  out[unlabeled & pair('treatment', 'problem')] = 'NTrP'
+  out[unlabeled & pair('test',      'problem')] = 'NTeP'
+  out[unlabeled & pair('problem',   'problem')] = 'NPP'
+
+  # Special cases due to noisy training data
+  out[pair('test', 'test') | pair('treatment', 'treatment')] = np.nan
+
+  # Special case where other order does have a valid label.
+  if l:
+    other = np.array([k in l for k in zip(X.lineNum,
+                                          X.conStart2,
+                                          X.conEnd2,
+                                          X.conStart1,
+                                          X.conEnd1)], dtype=bool)
+    out[other] = X['relType'][other]
+
+  return out
+
 def filterUnlabeled(x):
   if x.relType in _LABELS[:8]:
     return x.relType
   return np.nan
 
-# Only want one of the two negative labeled examples for each entry
-def filterNegLabeled(x):
-  if x.relType in _LABELS[-3:] and x.conStart1 > x.conStart2:
-    return np.nan
-  return x.relType
-
 
 #
 # Feature extraction helpers
 #
 I = 1
 
-def insert(x):
+def sentence(x, trees):
+  """
+    Returns the parse tree of the entry's sentence and its span index.
+    trees keeps them by file and line, so each sentence is parsed once
+    for all of its concept pairs.
+  """
+  key = (x.fileName, x.lineNum)
+  if key not in trees:
+    t = tree.createTree(x.parse)
+    trees[key] = (t, tree.indexSpans(t))
+  return trees[key]
+
+def insert(x, trees=None):
   if int(x.conStart2) > int(x.conStart1):
     cStart1 = int(x.conStart1)
     cEnd1   = int(x.conEnd1)
@@ -125,18 +198,18 @@ def insert(x):
     cStart2 = int(x.conStart1)
     cEnd2   = int(x.conEnd1)
     cType2  = x.conType1
-  if V:
-    print "Inserting: %s, line: %s" % (x.fileName, x.lineNum)
+  t, index = sentence(x, trees if trees != None else dict())
   return tree.createString(tree.insert(
-           tree.createTree(x.parse),
+           t,
            cStart1,
            cEnd1,
            cType1,
            cStart2,
            cEnd2,
-           cType2))
+           cType2,
+           index))
 
-def suffix(x):
+def suffix(x, trees=None):
   if int(x.conStart2) > int(x.conStart1):
     cStart1 = int(x.conStart1)
     cEnd1   = int(x.conEnd1)
@@ -151,18 +224,18 @@ def suffix(x):
     cStart2 = int(x.conStart1)
     cEnd2   = int(x.conEnd1)
     cType2  = x.conType1
-  if V:
-    print "Suffixing: %s, line: %s" % (x.fileName, x.lineNum)
+  t, index = sentence(x, trees if trees != None else dict())
   return tree.createString(tree.suffix(
-           tree.createTree(x.parse),
+           t,
            cStart1,
            cEnd1,
            cType1,
            cStart2,
            cEnd2,
-           cType2))
+           cType2,
+           index))
 
-def spt(x):
+def spt(x, trees=None):
   if int(x.conStart2) > int(x.conStart1):
     cStart1 = int(x.conStart1)
     cEnd1   = int(x.conEnd1)
@@ -173,12 +246,12 @@ def spt(x):
     cEnd1   = int(x.conEnd2)
     cStart2 = int(x.conStart1)
     cEnd2   = int(x.conEnd1)
-  if V:
-    print "Finding spt for: %s, line: %s" % (x.fileName, x.lineNum)
+  t, index = sentence(x, trees if trees != None else dict())
   return tree.createString(tree.spt(
-           tree.createTree(x.parse),
+           t,
            cStart1,
-           cEnd2))
+           cEnd2,
+           index))
 
 def entityFeature(x):
   """
@@ -211,8 +284,6 @@ def entityFeature(x):
       ...
     ValueError: Invalid concept types given: test and treatment.
   """
-  if V:
-    print "Finding entity vector for: %s, line: %s" % (x.fileName, x.lineNum)
   cons = (x.conType1, x.conType2)
   if cons == ('test', 'problem'):
     return '1:1 6:1'
@@ -227,204 +298,516 @@ def entityFeature(x):
   raise ValueError('Invalid concept types given: %s and %s.' % (cons[0], cons[1]))
 
 
-def train(data, flags):
-  # Initialize training files
-  for label in _LABELS:
-    f_name = os.path.join(absPath('./svm'), label + '.tmp')
-    with open(f_name, 'w') as f:
-      pass
-
-  parses = note.filterFiles(flags[0], 'parse')
-
-  for ((c,t,r),p) in zip(data, parses):
-    X = note.createTraining(c, t, r)
-    if type(X) == type(None) or X.empty:
-      continue
-    # Generate negative examples
-    X['relType'] = X.apply(genNeg, axis=1, args=(X[X['relType'].notnull()],))
-
-    # Split number of negative examples in half by taking only the ordered ones.
-    X['relType'] = X.apply(filterNegLabeled, axis=1)
-
-    # Filter invalid entries (i.e. test/treatment combinations)
-    X = X[X['relType'].notnull()]
+def parseFlags(flags):
+  """
+    Splits the model flags into arguments (parse directory and enrichment)
+    and options.
+    --jobs N         extract features over N processes.
+    --engine python  score with kernel.py instead of svm_classify, and train
+                     with learn.py instead of svm_learn.
+    --batch N        classify N documents at a time when predicting.
+    --learners N     run N svm_learn at a time when training.
+    --queue DIR      extract features through a work queue in DIR, on shared
+                     storage, with --jobs local workers (see workqueue.py).
+    --shard N        documents per shard of the work queue.
+    --types T:T,...  concept type pairs kept as candidates, or 'any'.
+                     Treatment, test and problem pairs with a problem by
+                     default.
+    --max-distance N leave out pairs more than N tokens apart.
+    --max-between N  leave out pairs with more than N concepts between them.
+    >>> opts = parseFlags(['parse/', 'insert'])[1]
+    >>> opts['jobs'], opts['engine'], opts['batch'], opts['queue']
+    (1, 'svmlight', 1000, None)
+    >>> parseFlags(['--jobs', '4', 'parse/', '--engine', 'python'])[0]
+    ['parse/']
+    >>> parseFlags(['--types', 'any', '--max-distance', '10'])[1]['prune']
+    Pruning(types=None, distance=10, between=None)
+  """
+  opts, args = getopt.gnu_getopt(flags, '', ['jobs=', 'engine=', 'batch=',
+                                             'learners=', 'queue=', 'shard=',
+                                             'types=', 'max-distance=',
+                                             'max-between='])
+  out = {'jobs': 1, 'engine': 'svmlight', 'batch': 1000, 'learners': 1,
+         'queue': None, 'shard': 10}
+  prune = {'types': _TYPES, 'distance': None, 'between': None}
+  for o, v in opts:
+    if o == '--jobs':
+      out['jobs'] = int(v)
+    elif o == '--queue':
+      out['queue'] = os.path.abspath(v)
+    elif o == '--shard':
+      out['shard'] = int(v)
+    elif o == '--types':
+      prune['types'] = None if v == 'any' else [tuple(t.split(':'))
+                                                for t in v.split(',')]
+      if prune['types'] and any(len(t) != 2 for t in prune['types']):
+        raise getopt.GetoptError('Invalid types: %s' % v)
+    elif o == '--max-distance':
+      prune['distance'] = int(v)
+    elif o == '--max-between':
+      prune['between'] = int(v)
+    elif o == '--learners':
+      out['learners'] = int(v)
+    elif o == '--batch':
+      out['batch'] = int(v)
+    elif o == '--engine':
+      if v not in ('svmlight', 'python'):
+        raise getopt.GetoptError('Invalid engine: %s' % v)
+      out['engine'] = v
+  out['prune'] = note.Pruning(**prune)
+  return args, out
+
+def mapDocs(func, tasks, jobs=1, queue=None, shard=10):
+  """
+    Applies func to each task, over a pool of processes if jobs > 1, or
+    through a work queue in the directory queue, with jobs local workers
+    and any started on other hosts (see workqueue.py).
+    Results are given in the order of the tasks.
+    >>> list(mapDocs(abs, [-1, 2, -3]))
+    [1, 2, 3]
+    >>> list(mapDocs(abs, [-1, 2, -3], 2))
+    [1, 2, 3]
+  """
+  if queue != None:
+    for out in queued(func, tasks, queue, jobs, shard):
+      yield out
+    return
+
+  if jobs < 2:
+    for task in tasks:
+      yield func(task)
+    return
+
+  # Workers send their stage counters back with each result.
+  import multiprocessing
+  pool = multiprocessing.Pool(jobs)
+  try:
+    for out, counters in pool.imap(instrument.collected(func), tasks):
+      instrument.merge(counters)
+      yield out
+    pool.close()
+  finally:
+    pool.terminate()
+    pool.join()
+
+def queued(func, tasks, queue, workers, shard):
+  """
+    Helper for mapDocs, runs the tasks through a work queue. The queue
+    directory is created for the run, and removed once it is over.
+  """
+  import workqueue
+  if os.path.exists(queue):
+    raise ValueError('Work queue already exists: %s' % queue)
+
+  n = workqueue.submit(queue, instrument.collected(func), list(tasks), shard,
+                       note.cacheDir())
+  print >>sys.stderr, 'Work queue: %d shards in %s' % (n, queue)
+  procs = workqueue.start(queue, workers)
+  try:
+    for out, counters in workqueue.results(queue, procs):
+      instrument.merge(counters)
+      yield out
+  finally:
+    shutil.rmtree(queue, ignore_errors=True)
+    for p in procs:
+      if p.poll() == None:
+        p.terminate()
+      p.wait()
+
+def parseFile(p_dir, t):
+  """
+    The parse file of the text file t.
+    >>> parseFile('parse', '../i2b2_examples/txt/health.txt')
+    'parse/health.parse'
+  """
+  return os.path.join(p_dir, note.docName(t) + '.parse')
 
-    if X.empty:
-      continue
+def docTask(d, p_dir, mode, prune):
+  """
+    The task of the document files d, for trainDoc or predictDoc. Paths
+    are absolute, so workers of a queue find them from any directory.
+    >>> d, p, mode, prune = docTask(('a.con', 'a.txt'), 'parse', None, None)
+    >>> d[0] == os.path.abspath('a.con'), p == os.path.abspath('parse/a.parse')
+    (True, True)
+  """
+  d = tuple(os.path.abspath(f) for f in d)
+  return d, os.path.abspath(parseFile(p_dir, d[1])), mode, prune
 
-    # Obtain parse trees
-    P = bParser.extractPars(p)
+def features(X, p, t, mode):
+  """
+    Adds the enriched parse tree and entity vector of each entry.
+  """
+  # Obtain parse trees, parsing the text t if it hasn't been, or if it
+  # changed since (see bParser.current).
+  with instrument.stage('parse load') as s:
+    if os.path.exists(p) and bParser.current(p, t):
+      P = note.cached(bParser.extractPars)(p)
+    else:
+      P = bParser.extractPars(p, t)
+    s.rows += len(P)
+  with instrument.stage('parse merge', len(X)):
     X = pd.merge(X, P, how='left')
 
-    # Enrich parse trees
-    if len(flags) > 1:
-      if flags[1] == 'insert':
-        X['parse'] = X.apply(insert, axis=1)
-      elif flags[1] == 'suffix':
-        X['parse'] = X.apply(suffix, axis=1)
-      else:
-        return 'Invalid flag.'
+  # Enrich parse trees, parsing each sentence once.
+  with instrument.stage('enrichment', len(X)):
+    trees = dict()
+    if mode == 'insert':
+      X['parse'] = X.apply(insert, axis=1, args=(trees,))
+    elif mode == 'suffix':
+      X['parse'] = X.apply(suffix, axis=1, args=(trees,))
     else:
-      X['parse'] = X.apply(spt, axis=1)
+      X['parse'] = X.apply(spt, axis=1, args=(trees,))
 
     # Create entity vectors
     X['vec'] = X.apply(entityFeature, axis=1)
 
-    # Write to svm files
-    for label in _LABELS:
-      f_name = os.path.join(absPath('./svm'), label + '.tmp')
-      with open(f_name, 'a') as f:
-        def svmTrain(x):
-          """
-            Temporary function to write svm training files.
-          """
-          if x.relType == label:
-            y = '1'
-          else:
-            y = '-1'
-          if x.parse == '()':
-            p = ' '
-          else:
-            p = ' ' + x.parse + ' '
-
-          out = y + ' |BT|' + p + '|ET| ' + x.vec + ' |EV|\n'
-          f.write(out)
-          return
-
-        X.apply(svmTrain, axis=1)
-
-  # Train svms
-  for label in _LABELS:
-    f_name = os.path.join(absPath('./svm'), label + '.tmp')
-    subprocess.call([absPath('./svm-light-TK-1.2.1/svm_learn'),
-                     '-t', '5',
-                     '-S', '1',
-                     '-D', '1',
-                     '-r', '1',
-                     '-c', '0.5',
-                     '-d', '2',
-                     '-T', '3.35',
-                     '-N', '3',
-                     '-W', 'S',
-                     '-v', '0',
-                     f_name,
-                     f_name.split('.tmp')[0] + '.svm',
-                    ])
-
-    os.remove(f_name)
+  return X
 
-  # Returns nothing on success
-  return
-
-def predict(data, flags):
+def trainDoc(task):
+  """
+    Creates the training entries of one document.
+    Returns None if the document has none.
+    Entries are kept in the cache by the content of the document's files
+    and the mode, so only new or changed documents are processed again.
+  """
+  (c,t,r),p,mode,prune = task
 
-  parses = note.filterFiles(flags[0], 'parse')
+  if not os.path.exists(p):
+    bParser.extractPars(p, t)
 
-  for ((c,t),p) in zip(data, parses):
-    X = note.createTesting(c, t)
-    if type(X) == type(None) or X.empty:
-      f_name = os.path.basename(t).split(".")[0]
-      with open(os.path.join(absPath('../../predictions'),
-                               f_name + '.pred'), 'w') as f:
-        continue
+  return note.cached(docEntries, content=True)(c, t, r, p, mode=mode,
+                                               prune=prune)
 
-    # Generate negative examples
-    X['relType'] = X.apply(genNeg, axis=1)
+def docEntries(c, t, r, p, mode=None, prune=None):
+  """
+    Helper for trainDoc, creates the relation type, enriched parse tree and
+    entity vector of each training entry of a document.
+  """
+  # Only one of the two orders of each concept pair is needed, so pairs
+  # are generated once, in the order of their relation if they have one.
+  X = note.createTraining(c, t, r, unordered=True, prune=prune)
+  if type(X) == type(None) or X.empty:
+    return None
+  # Generate negative examples
+  with instrument.stage('negatives', len(X)):
+    X['relType'] = negLabels(X, relationKeys(X[X['relType'].notnull()]))
 
     # Filter invalid entries (i.e. test/treatment combinations)
     X = X[X['relType'].notnull()]
-    if X.empty:
-      f_name = os.path.basename(t).split(".")[0]
-      with open(os.path.join(absPath('../../predictions'),
-                               f_name + '.pred'), 'w') as f:
-        continue
 
-    # Obtain parse trees
-    P = bParser.extractPars(p)
-    X = pd.merge(X, P, how='left')
+  if X.empty:
+    return None
 
-    # Enrich parse trees
-    if len(flags) > 1:
-      if flags[1] == 'insert':
-        X['parse'] = X.apply(insert, axis=1)
-      elif flags[1] == 'suffix':
-        X['parse'] = X.apply(suffix, axis=1)
-      else:
-        return 'Invalid flag.'
-    else:
-      X['parse'] = X.apply(spt, axis=1)
+  return features(X, p, t, mode)[['relType', 'parse', 'vec']]
 
-    # Create entity vectors
-    X['vec'] = X.apply(entityFeature, axis=1)
+def predictDoc(task):
+  """
+    Creates the entries of one document to make predictions on.
+    Returns the document name, and its entries or None if it has none.
+  """
+  (c,t),p,mode,prune = task
+  f_name = os.path.basename(t).split(".")[0]
+
+  X = note.createTesting(c, t, prune=prune)
+  if type(X) == type(None) or X.empty:
+    return f_name, None
 
+  # Generate negative examples
+  with instrument.stage('negatives', len(X)):
+    X['relType'] = negLabels(X)
 
-    # Make predictions
-    f_name = os.path.join(absPath("./svm"), 'predict.tmp')
+    # Filter invalid entries (i.e. test/treatment combinations)
+    X = X[X['relType'].notnull()]
+  if X.empty:
+    return f_name, None
+
+  return f_name, features(X, p, t, mode)
+
+def predLine(x):
+  """
+    Returns the svm input line of an entry to make predictions on.
+  """
+  if x.parse == '()':
+    p = ' '
+  else:
+    p = ' ' + x.parse + ' '
+  return '|BT| (' + p + ') |ET| ' + x.vec + ' |EV|\n'
+
+def trainLine(x):
+  """
+    Returns the svm input line of a training entry, without its target,
+    which depends on the label trained (see overlay).
+  """
+  if x.parse == '()':
+    p = ' '
+  else:
+    p = ' ' + x.parse + ' '
+  return '|BT|' + p + '|ET| ' + x.vec + ' |EV|\n'
 
-    first = True
+def overlay(instances, targets, f_name):
+  """
+    Writes the svm_learn input of a label: each line of the instances file,
+    after target 1 where targets is true and -1 elsewhere.
+    >>> import tempfile
+    >>> d = tempfile.mkdtemp()
+    >>> i, o = os.path.join(d, 'instances'), os.path.join(d, 'label')
+    >>> with open(i, 'w') as f:
+    ...   f.write('|BT| (A) |ET| 1:1 |EV|\\n|BT| (B) |ET| 3:1 |EV|\\n')
+    >>> overlay(i, np.array([False, True]), o)
+    >>> print open(o).read(),
+    -1 |BT| (A) |ET| 1:1 |EV|
+    1 |BT| (B) |ET| 3:1 |EV|
+    >>> import shutil; shutil.rmtree(d)
+  """
+  with open(instances, 'r') as src:
     with open(f_name, 'w') as f:
-      def svmPred(x):
-        """
-          Temporary function to write svm training files.
-        """
-        if x.parse == '()':
-          p = ' '
-        else:
-          p = ' ' + x.parse + ' '
-        out = '|BT| (' + p + ') |ET| ' + x.vec + ' |EV|\n'
-        f.write(out)
-        return
-
-      X.apply(svmPred, axis=1)
+      for y, line in itertools.izip(targets, src):
+        f.write('1 ' if y else '-1 ')
+        f.write(line)
 
+def classify(lines, engine='svmlight'):
+  """
+    Scores svm input lines with the svm of each label, with svm_classify
+    or in this process (engine 'python', see kernel.py).
+    Returns an array with a row per line and a column per label.
+  """
+  if engine == 'python':
+    import kernel
+    opts = kernel.readOptions(_SVM_FLAGS)
+    models = [kernel.load(os.path.join(absPath("./svm"), label + '.svm'), opts)
+              for label in _LABELS]
+    return np.array([[m.score(line) for m in models] for line in lines])
+
+  f_name = os.path.join(absPath("./svm"), 'predict.tmp')
+  with open(f_name, 'w') as f:
+    f.writelines(lines)
+
+  results = list()
+  for label in _LABELS:
+    m_name = os.path.join(absPath("./svm"), label + '.svm')
+    r_name = os.path.join(absPath("./svm"), label + '.predict')
+    subprocess.call([absPath('./svm-light-TK-1.2.1/svm_classify'),
+                     f_name,
+                     m_name,
+                     r_name])
+    r_label = list()
+    with open(r_name, 'r') as f:
+      for line in f:
+        r_label.append(float(line))
+    results.append(r_label)
+    os.remove(r_name)
+  os.remove(f_name)
+
+  return np.array(results).T
+
+def train(data, flags):
+  args, opts = parseFlags(flags)
+  mode = args[1] if len(args) > 1 else None
+  if mode not in (None, 'insert', 'suffix'):
+    return 'Invalid flag.'
+
+  # Instances are written once, without a target, to a file shared by all
+  # labels. The input of each svm_learn is made from it by overlaying the
+  # targets of its label (see overlay) just before it runs.
+  instances = os.path.join(absPath('./svm'), 'instances.tmp')
+  tasks  = (docTask(d, args[0], mode, opts['prune']) for d in data)
+  labels = list()
+  progress = instrument.Progress('documents', len(data))
+
+  try:
+    with open(instances, 'w') as f:
+      for X in mapDocs(trainDoc, tasks, opts['jobs'],
+                           opts['queue'], opts['shard']):
+        progress.update()
+        if type(X) == type(None):
+          continue
+
+        with instrument.stage('svm write', len(X)):
+          f.writelines(X.apply(trainLine, axis=1))
+          labels.append(X['relType'].values)
+    labels = np.concatenate(labels) if labels else np.array([], dtype=object)
+
+    if opts['engine'] == 'python':
+      learnAll(instances, labels)
+      return
+
+    # Train svms, --learners at a time.
+    import scheduler
+    jobs = list()
     for label in _LABELS:
-      m_name = os.path.join(absPath("./svm"), label + '.svm')
-      r_name = os.path.join(absPath("./svm"), label + '.predict')
-      subprocess.call([absPath('./svm-light-TK-1.2.1/svm_classify'),
-                       f_name,
-                       m_name,
-                       r_name])
-      r_label = list()
-      with open(r_name, 'r') as f:
-        for line in f:
-          r_label.append(float(line))
-      if first:
-        results = np.array(r_label).reshape(len(r_label),1)
-        first = False
-      else:
-        results = np.concatenate((results,
-                                  np.array(r_label).reshape(len(r_label),1)),
-                                  axis=1)
-      os.remove(r_name)
-    os.remove(f_name)
+      f_name = os.path.join(absPath('./svm'), label + '.tmp')
+      jobs.append((label,
+                   [absPath('./svm-light-TK-1.2.1/svm_learn')] +
+                   _SVM_FLAGS +
+                   [f_name,
+                    f_name.split('.tmp')[0] + '.svm',
+                   ],
+                   functools.partial(overlay, instances, labels == label,
+                                     f_name),
+                   functools.partial(os.remove, f_name)))
+    with instrument.stage('svm_learn', len(labels)):
+      scheduler.run(jobs, opts['learners'])
+  finally:
+    if os.path.exists(instances):
+      os.remove(instances)
+    note.pruneSummary(_PAIR_STAGES)
 
-    out = [_LABELS[r] for r in results.argmax(axis=1)]
+  # Returns nothing on success
+  return
 
-    X['relType'] = out
+def learnAll(instances, labels):
+  """
+    Trains the svm of each label in this process (see learn.py), over the
+    Gram matrix of the instances, kept in _GRAM between runs.
+  """
+  import gram
+  import learn
+  import kernel
+  with open(instances, 'r') as f:
+    lines = f.readlines()
+  opts = kernel.readOptions(_SVM_FLAGS)
+  with instrument.stage('learn', len(lines) * len(_LABELS)):
+    g = gram.Gram(_GRAM, lines, opts)
+    try:
+      learn.train(g, lines, labels, _LABELS, opts, absPath('./svm'))
+    finally:
+      g.close()
+  print >>sys.stderr, 'Gram matrix: %d rows read, %d computed of %d.' % (
+                        g.reads, g.computed, len(g))
+
+def writePredictions(f_name, X, results):
+  """
+    Labels each entry with its highest scoring svm, and writes the positive
+    relations to the document's prediction file.
+  """
+  with open(os.path.join(absPath('../../predictions'),
+                           f_name + '.pred'), 'w') as f:
+    if type(X) == type(None):
+      return
 
-    # Write predictions to file
-    f_name = set(X['fileName']).pop()
+    X['relType'] = [_LABELS[r] for r in results.argmax(axis=1)]
 
     # Filter out non-positive labels
     X['relType'] = X.apply(filterUnlabeled,axis=1)
     X = X[X['relType'].notnull()]
 
-    with open(os.path.join(absPath('../../predictions'),
-                             f_name + '.pred'), 'w') as f:
-      def writeToFile(d):
-        f.write(note.writeRel(d) + '\n')
+    def writeToFile(d):
+      f.write(note.writeRel(d) + '\n')
+
+    if X.empty:
+      return
+
+    X.apply(writeToFile, axis=1)
+
+def predict(data, flags):
+  args, opts = parseFlags(flags)
+  mode = args[1] if len(args) > 1 else None
+  if mode not in (None, 'insert', 'suffix'):
+    return 'Invalid flag.'
 
-      if X.empty:
-        continue
+  progress = instrument.Progress('documents', len(data))
+  for f_name in predictions(data, args[0], mode, opts):
+    progress.update()
 
-      X.apply(writeToFile, axis=1)
+  note.pruneSummary(_PAIR_STAGES + ['svm_classify', 'predictions'])
 
   return
 
+def stream(data, flags):
+  """
+    Predicts documents as data gives them, one at a time, and yields the
+    name of each document once its predictions are written.
+    Scoring in this process (--engine python) keeps the svms loaded between
+    documents, instead of running svm_classify for each one.
+  """
+  args, opts = parseFlags(flags)
+  mode = args[1] if len(args) > 1 else None
+  if mode not in (None, 'insert', 'suffix'):
+    raise ValueError('Invalid flag.')
+
+  opts['batch'] = 1
+  return predictions(data, args[0], mode, opts, skip=True)
+
+def streamDoc(task):
+  """
+    predictDoc for streams: a document that fails gives its error in place
+    of its entries, so the documents after it are still predicted.
+  """
+  try:
+    return predictDoc(task)
+  except Exception as e:
+    return os.path.basename(task[0][1]).split(".")[0], e
+
+def predictions(data, p_dir, mode, opts, skip=False):
+  """
+    Helper for predict and stream, writes the predictions of each document
+    and yields its name. With skip, documents that fail are reported on
+    stderr and left out.
+  """
+  tasks  = (docTask(d, p_dir, mode, opts['prune']) for d in data)
+  docs   = mapDocs(streamDoc if skip else predictDoc, tasks, opts['jobs'],
+                   opts['queue'], opts['shard'])
+
+  # Documents are classified in batches, so each svm is run once per batch.
+  while True:
+    batch = list(itertools.islice(docs, opts['batch']))
+    if len(batch) == 0:
+      break
+
+    # Documents that failed (see streamDoc).
+    for f_name, X in batch:
+      if isinstance(X, Exception):
+        skipped(f_name, X)
+    batch = [(f_name, X) for f_name, X in batch
+                         if not isinstance(X, Exception)]
+    if len(batch) == 0:
+      continue
+
+    try:
+      predictBatch(batch, opts['engine'])
+    except Exception as e:
+      if not skip:
+        raise
+      skipped(', '.join(f_name for f_name, X in batch), e)
+      continue
+
+    for f_name, X in batch:
+      yield f_name
+
+def skipped(name, e):
+  """ Reports documents left out of a stream, and why. """
+  print >>sys.stderr, 'Skipping %s: %s: %s' % (name, type(e).__name__, e)
+
+def predictBatch(batch, engine):
+  """
+    Helper for predictions, classifies the entries of a batch of documents
+    and writes the predictions of each.
+  """
+  with instrument.stage('svm write') as s:
+    lines = list()
+    for f_name, X in batch:
+      if type(X) != type(None):
+        lines.extend(X.apply(predLine, axis=1))
+    s.rows += len(lines)
+
+  # Make predictions
+  if len(lines) > 0:
+    with instrument.stage('svm_classify', len(lines)):
+      results = classify(lines, engine)
+
+  # Split the results back into documents
+  with instrument.stage('predictions', len(lines)):
+    i = 0
+    for f_name, X in batch:
+      if type(X) == type(None):
+        writePredictions(f_name, None, None)
+      else:
+        writePredictions(f_name, X, results[i:i + len(X)])
+        i += len(X)
+
 if __name__ == '__main__':
-  from pandas import Series
+  from pandas import Series, DataFrame
   from numpy import nan
-  V = False
   test1  = Series({'conType1': 'treatment', 'conType2': 'problem', 'relType': nan})
   test2  = Series({'conType1': 'problem',   'conType2': 'problem', 'relType': nan})
   test3  = Series({'conType1': 'test',      'conType2': 'problem', 'relType': nan})
@@ -434,11 +817,12 @@ if __name__ == '__main__':
   test7  = Series({'conType2': 'test',      'conType1': 'problem', 'relType': nan})
   test8 = Series({'conType2': 'problem',   'conType1': 'test',    'relType': 'TeIP'})
   test9 = Series({'conType2': 'treatment', 'conType1': 'test',    'relType': nan})
+  sys.path.append(absPath('../../src'))
+  import note
+  import instrument
   import doctest
   doctest.testmod()
 else:
- # V = False
-  V = True
-
   sys.path.append(absPath('../'))
   import note
+  import instrument
@@ -0,0 +1,200 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : parseCache.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Persistent cache of sentence parses.
+           Clinical notes repeat many sentences (headers, medications,
+           normal findings), so parses are kept by a hash of the sentence
+           and of the grammar used, in an sqlite database. Only sentences
+           that were never parsed with the grammar need the parser.
+           The database file is kept under a size limit by removing the
+           least recently used parses, and giving their pages back to the
+           file system. Grammars are hashed once, and their hash kept by
+           the path, size and modification time of their file.
+
+"""
+
+import os
+import sqlite3
+import hashlib
+
+class ParseCache(object):
+  """
+    >>> import tempfile
+    >>> c = ParseCache(os.path.join(tempfile.mkdtemp(), 'parses.db'), 'g')
+    >>> c.get(['This is a test .', 'Another one .'])
+    [None, None]
+    >>> c.put(['This is a test .'], ['( (S (NP (DT This)) ...) )'])
+    >>> c.get(['This  is a test .', 'Another one .'])
+    ['( (S (NP (DT This)) ...) )', None]
+    >>> c.stats()
+    'Parse cache: 1 hits, 3 misses (25.0% hit rate).'
+
+    maxSize bounds the size of the database file.
+    >>> path = os.path.join(tempfile.mkdtemp(), 'parses.db')
+    >>> c = ParseCache(path, 'g', maxSize=2**16)
+    >>> for i in range(200):
+    ...   c.put(['Sentence %d .' % i], ['( (S %s) )' % ('x' * 1000)])
+    >>> os.path.getsize(path) <= 2**16
+    True
+    >>> c.get(['Sentence 0 .', 'Sentence 199 .'])[0] is None
+    True
+  """
+
+  def __init__(self, path, grammar, maxSize=2**30):
+    self.maxSize = maxSize
+    self.hits    = 0
+    self.misses  = 0
+
+    d = os.path.dirname(path)
+    if d and not os.path.isdir(d):
+      os.makedirs(d)
+    self.db = sqlite3.connect(path, timeout=60)
+    self.db.text_factory = str
+    if self.db.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+      # Lets evict shrink the file. A database made without it is
+      # rebuilt once.
+      self.db.execute('PRAGMA auto_vacuum = INCREMENTAL')
+      self.db.execute('VACUUM')
+    with self.db:
+      self.db.execute('CREATE TABLE IF NOT EXISTS parses '
+                      '(key TEXT PRIMARY KEY, parse TEXT, '
+                      ' size INTEGER, used INTEGER)')
+      self.db.execute('CREATE INDEX IF NOT EXISTS parses_used '
+                      'ON parses (used)')
+      self.db.execute('CREATE TABLE IF NOT EXISTS grammars '
+                      '(path TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+                      ' id TEXT)')
+    self.grammar = self._grammarId(grammar)
+
+  def key(self, sentence):
+    """ Sentences are compared by their tokens. """
+    return hashlib.sha1(self.grammar + '\0' + ' '.join(sentence.split())
+                        ).hexdigest()
+
+  def get(self, sentences):
+    """
+      Returns the cached parse of each sentence, or None.
+    """
+    keys = [self.key(s) for s in sentences]
+    found = dict()
+    # sqlite limits the number of parameters of a query.
+    for i in range(0, len(keys), 500):
+      chunk = keys[i:i + 500]
+      marks = ','.join('?' * len(chunk))
+      found.update(self.db.execute('SELECT key, parse FROM parses '
+                                   'WHERE key IN (%s)' % marks, chunk))
+    if found:
+      with self.db:
+        self.db.executemany('UPDATE parses SET used = ? WHERE key = ?',
+                            [(self._clock(), k) for k in found])
+
+    out = [found.get(k) for k in keys]
+    hits = len(out) - out.count(None)
+    self.hits   += hits
+    self.misses += len(out) - hits
+    return out
+
+  def put(self, sentences, parses):
+    """
+      Stores the parse of each sentence.
+    """
+    rows = [(self.key(s), p, len(p), self._clock())
+            for s, p in zip(sentences, parses)]
+    with self.db:
+      self.db.executemany('INSERT OR REPLACE INTO parses '
+                          'VALUES (?, ?, ?, ?)', rows)
+    self.evict()
+
+  def evict(self):
+    """
+      Removes the least recently used parses until the database file fits
+      in maxSize bytes. Rows take more than their parses (keys, index,
+      free space in pages), so parses are removed in proportion to the
+      bytes of pages in use, until these fit.
+    """
+    removed = False
+    while self._usedBytes() > self.maxSize:
+      used = self._usedBytes()
+      size = self.db.execute('SELECT SUM(size) FROM parses').fetchone()[0]
+      if not size:
+        break
+      keep = size * self.maxSize // used
+      remove = list()
+      for key, s in self.db.execute('SELECT key, size FROM parses '
+                                    'ORDER BY used'):
+        if remove and size <= keep:
+          break
+        remove.append((key,))
+        size -= s
+      with self.db:
+        self.db.executemany('DELETE FROM parses WHERE key = ?', remove)
+      removed = True
+    if removed:
+      self.db.execute('PRAGMA incremental_vacuum')
+
+  def _usedBytes(self):
+    """ Bytes of the database file in pages that are in use. """
+    pages = self.db.execute('PRAGMA page_count').fetchone()[0]
+    free  = self.db.execute('PRAGMA freelist_count').fetchone()[0]
+    return (pages - free) * self.db.execute('PRAGMA page_size').fetchone()[0]
+
+  def _grammarId(self, grammar):
+    """
+      grammarId, with the hash of a grammar file kept by its path, size
+      and modification time, as grammars are large.
+    """
+    if not os.path.isfile(grammar):
+      return grammar
+    path = os.path.abspath(grammar)
+    s = os.stat(path)
+    row = self.db.execute('SELECT id FROM grammars WHERE path = ? AND '
+                          'size = ? AND mtime = ?',
+                          (path, s.st_size, s.st_mtime)).fetchone()
+    if row:
+      return row[0]
+    gid = grammarId(path)
+    with self.db:
+      self.db.execute('INSERT OR REPLACE INTO grammars VALUES (?, ?, ?, ?)',
+                      (path, s.st_size, s.st_mtime, gid))
+    return gid
+
+  def _clock(self):
+    """ Increasing use counter, for least recently used eviction. """
+    if not hasattr(self, '_used'):
+      self._used = self.db.execute('SELECT MAX(used) FROM parses'
+                                   ).fetchone()[0] or 0
+    self._used += 1
+    return self._used
+
+  def stats(self):
+    total = self.hits + self.misses
+    rate = 100.0 * self.hits / total if total else 0.0
+    return 'Parse cache: %d hits, %d misses (%.1f%% hit rate).' % (self.hits,
+                                                                 self.misses,
+                                                                 rate)
+
+  def close(self):
+    self.db.close()
+
+def grammarId(grammar):
+  """
+    Identifies a grammar by the hash of its file, or by its name if
+    there is no such file.
+  """
+  if not os.path.isfile(grammar):
+    return grammar
+  h = hashlib.sha1()
+  with open(grammar, 'rb') as f:
+    for block in iter(lambda: f.read(2**20), ''):
+      h.update(block)
+  return h.hexdigest()
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod()
@@ -0,0 +1,103 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : scheduler.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Runs external programs (i.e. one svm_learn per label)
+           concurrently, up to a number of workers at a time.
+           The output of each program is streamed as it runs, prefixed with
+           its name. If one fails, the others are stopped.
+           A job can prepare its input just before it starts, and clean it up
+           once it ends, so inputs only take space while they are used.
+
+"""
+
+import sys
+import time
+import threading
+import subprocess
+
+def run(jobs, workers=1, out=None, poll=0.1):
+  """
+    Runs the jobs, a list of (name, command) pairs, starting them in the
+    given order. Their output is written to out (stdout by default).
+    A job may also be (name, command, before, after): before is called
+    right before the command starts, and after once it has ended, whether
+    it succeeded or not.
+    Raises CalledProcessError as soon as one fails, after
+    stopping the others.
+    >>> run([('a', ['echo', 'first']), ('b', ['echo', 'second'])])
+    [a] first
+    [b] second
+    >>> def say(s): print s
+    >>> run([('a', ['echo', 'job'], lambda: say('before'), lambda: say('after'))])
+    before
+    [a] job
+    after
+    >>> run([('a', ['sh', '-c', 'exit 3']), ('b', ['sleep', '5'])], 2)
+    Traceback (most recent call last):
+      ...
+    CalledProcessError: Command '['sh', '-c', 'exit 3']' returned non-zero exit status 3
+  """
+  if out == None:
+    out = sys.stdout
+
+  lock    = threading.Lock()
+  queue   = list(jobs)
+  running = list()
+
+  try:
+    while queue or running:
+      while queue and len(running) < workers:
+        job = queue.pop(0)
+        name, cmd = job[:2]
+        before, after = job[2:] if len(job) > 2 else (None, None)
+        if before:
+          before()
+        proc = subprocess.Popen(cmd,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT)
+        log = threading.Thread(target=_stream,
+                               args=(name, proc.stdout, out, lock))
+        log.daemon = True
+        log.start()
+        running.append((proc, cmd, log, after))
+
+      for job in list(running):
+        proc, cmd, log, after = job
+        if proc.poll() == None:
+          continue
+        running.remove(job)
+        log.join()
+        if after:
+          after()
+        if proc.returncode != 0:
+          raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+      time.sleep(poll)
+  finally:
+    # Stop whatever is still running (on failure or interruption).
+    for proc, cmd, log, after in running:
+      if proc.poll() == None:
+        proc.terminate()
+      proc.wait()
+      if after:
+        after()
+
+def _stream(name, pipe, out, lock):
+  """
+    Helper for run, copies the output of a program line by line.
+  """
+  for line in iter(pipe.readline, ''):
+    with lock:
+      out.write('[%s] %s' % (name, line))
+      out.flush()
+  pipe.close()
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod()
@@ -14,17 +14,56 @@
 """
 
 import re
-tree_ex = re.compile(r"([^\(\) ]+)")
+import time
+tree_ex  = re.compile(r"([^\(\) ]+)")
+token_ex = re.compile(r"\(|\)|[^\(\)\s]+")
 
 from copy import deepcopy
 
-def createTree(s):
+def createTree(s, node=list):
   """
-    Takes a string and creates a list representation
+    Takes a string and creates a list representation.
+    The string is read once, left to right, keeping the open nodes on a stack.
+    node gives the type of each node; tuples are lighter than lists, but
+    can't be enriched in place.
     >>> createTree('()')
     []
     >>> createTree(test0)
     ['S', ['NP', ['DT', 'This']], ['VP', ['VBZ', 'is'], ['NP', ['DT', 'a'], ['NN', 'test'], ['NN', 'sentence']]], ['.', '.']]
+    >>> createTree(test0, tuple)[2]
+    ('VP', ('VBZ', 'is'), ('NP', ('DT', 'a'), ('NN', 'test'), ('NN', 'sentence')))
+    >>> createTree('(S (NP (NN "quoted")) (. \\"))')
+    ['S', ['NP', ['NN', '"quoted"']], ['.', '"']]
+    >>> createTree('(S (NP (NN test))')
+    Traceback (most recent call last):
+      ...
+    ValueError: Unbalanced parse tree: (S (NP (NN test))
+  """
+  stack = [[]]
+  for tok in token_ex.findall(s):
+    if tok == '(':
+      stack.append([])
+    elif tok == ')':
+      if len(stack) < 2:
+        raise ValueError('Unbalanced parse tree: %s' % s)
+      t = stack.pop()
+      stack[-1].append(node(t))
+    else:
+      # Quotes used to be escaped in parse files, see parse_texts.sh
+      stack[-1].append(tok.replace('\\"', '"'))
+
+  if len(stack) != 1:
+    raise ValueError('Unbalanced parse tree: %s' % s)
+  if len(stack[0]) == 0:
+    return node([])
+  return stack[0][0]
+
+def _evalTree(s):
+  """
+    Former createTree, kept for benchmarking.
+    Turns the string into python source and evaluates it.
+    >>> _evalTree(test0) == createTree(test0)
+    True
   """
   if s == '':
     return []
@@ -32,6 +71,26 @@ def createTree(s):
   # Make lists not tuples
   return eval(t.replace('(', '[').replace(')',']'))
 
+def benchmark(parFile, n=10):
+  """
+    Times reading every tree of a parse file n times, with createTree
+    (list and tuple nodes) and the former eval based reader.
+    Returns the seconds taken by each.
+  """
+  with open(parFile, 'r') as f:
+    parses = [line.strip()[2:-2] for line in f]
+
+  out = list()
+  for name, func in [('eval',  _evalTree),
+                     ('list',  createTree),
+                     ('tuple', lambda s: createTree(s, tuple))]:
+    start = time.time()
+    for i in range(n):
+      for s in parses:
+        func(s)
+    out.append((name, time.time() - start))
+  return out
+
 def getLeaves(tree):
   """
     Returns a string of the leaves of this particular branch.
@@ -82,10 +141,38 @@ def createString(tree):
 
   return out + ')'
  
-def spt(tree, conStart1, conEnd2, m=None, c=0):
+def indexSpans(tree):
+  """
+    Annotates every node of the tree with its token span, the indexes of
+    its first and last leaf. Returns a mapping from node id to span.
+    >>> t = createTree(test0)
+    >>> s = indexSpans(t)
+    >>> s[id(t)], s[id(t[2])], s[id(t[2][2])], s[id(t[2][2][3])]
+    ((0, 5), (1, 4), (2, 4), (4, 4))
+  """
+  index = dict()
+  _indexSpans(tree, index, 0)
+  return index
+
+def _indexSpans(tree, index, start):
+  """
+    Helper for indexSpans, returns the index following the last leaf.
+  """
+  end = start
+  for child in tree[1:]:
+    if type(child) == str:
+      end += 1
+    else:
+      end = _indexSpans(child, index, end)
+  index[id(tree)] = (start, end - 1)
+  return end
+
+def spt(tree, conStart1, conEnd2, index=None):
   """
     Finds the smallest subtree that still contains the two token ranges.
-    The challenge occurs when the two tokens are equal, or substrings of one another..
+    Starting at the root, moves to the child whose span covers the tokens
+    until there is none. index is the span index of the tree (see
+    indexSpans), it is created if not given.
     >>> spt(createTree(test0), 1, 4)
     ['VP', ['VBZ', 'is'], ['NP', ['DT', 'a'], ['NN', 'test'], ['NN', 'sentence']]]
     >>> spt(createTree(test8), 0, 4)
@@ -94,68 +181,73 @@ def spt(tree, conStart1, conEnd2, m=None, c=0):
     ['OO', ['JJ', 'medical'], ['NN', 'problem']]
     >>> spt(createTree(test8), 3, 4)
     ['NP', ['JJ', 'medical'], ['NN', 'problem']]
+    >>> spt(createTree(test10), 3, 4)
+    ['NP', ['JJ', 'Medical'], ['NN', 'problem'], ['VBN', 'indicated'], ['JJ', 'medical'], ['NN', 'problem']]
   """
-  out = tree
-  
-  if m == None:
-    # Create a mapping from tokens to id
-    m = getLeaves(tree).split()
-    # Determine number of times substring will occur before the correct subtree
-    c1 = getLeaves(tree).count(' '.join(m[conStart1:conEnd2+1]))
-    c2 = ' '.join(getLeaves(tree).split()[conStart1:]).count(' '.join(m[conStart1:conEnd2+1]))
-    c = c1 - c2
-  
-  curr = c
-  want_s = ' '.join(m[conStart1:conEnd2+1])
-
-  for child in tree[1:]:
-    if type(child) == str:
-      continue
+  if index == None:
+    index = indexSpans(tree)
 
-    if want_s in getLeaves(child):
-      if curr == 0:
-        return spt(child, conStart1, conEnd2, m, curr)
-      out = spt(child, conStart1, conEnd2, m, c)
-      curr -= 1
-
-  return out
+  out = tree
+  while True:
+    for child in out[1:]:
+      if type(child) == str:
+        continue
+      span = index.get(id(child))
+      if span and span[0] <= conStart1 and conEnd2 <= span[1]:
+        out = child
+        break
+    else:
+      return out
 
 def insert(tree, conStart1, conEnd1, conType1,
-                 conStart2, conEnd2, conType2):
+                 conStart2, conEnd2, conType2, index=None):
   """
     Inserts a node in front of the subtree containing each concept type.
+    index is the span index of the tree (see indexSpans).
+    Returns an enriched copy of the smallest subtree with both concepts,
+    the given tree is left unchanged.
     >>> insert(createTree(test0), 1, 1, 'IS', 3, 4, 'TEST')
     ['VP', ['IS', ['VBZ', 'is']], ['TEST', ['NP', ['DT', 'a'], ['NN', 'test'], ['NN', 'sentence']]]]
     >>> insert(createTree(test8), 0, 1, 'PROBLEM1', 3, 4, 'PROBLEM2')
     ['S', ['PROBLEM1', ['OO', ['JJ', 'medical'], ['NN', 'problem']]], ['VP', ['VBD', 'indicated'], ['NP', ['PROBLEM2', ['NP', ['JJ', 'medical'], ['NN', 'problem']]], [':', ';'], ['SBAR', ['WHNP', ['WDT', 'which']], ['S', ['VP', ['VBZ', 'is'], ['ADJP', ['RB', 'really'], ['JJ', 'important']]]]]]], ['.', '.']]
+    >>> insert(createTree(test0), 1, 4, 'IS', 3, 3, 'TEST')
+    ['IS', ['VP', ['VBZ', 'is'], ['NP', ['DT', 'a'], ['NN', 'test'], ['NN', 'sentence']]]]
   """
-  out = spt(tree, conStart1, conEnd2)
-  t1  = spt(tree, conStart1, conEnd1)
-  t2  = spt(tree, conStart2, conEnd2)
+  if index == None:
+    index = indexSpans(tree)
 
-  # Insertion
-  t1.append(deepcopy(t1))
-  del t1[:-1]
-  t1.insert(0, conType1)
+  out = spt(tree, conStart1, conEnd2, index)
+  t1  = spt(tree, conStart1, conEnd1, index)
+  t2  = spt(tree, conStart2, conEnd2, index)
+  out, t1, t2 = _copy(out, t1, t2)
 
-  t2.append(deepcopy(t2))
-  del t2[:-1]
-  t2.insert(0, conType2)
+  # Insertion
+  # The first concept is moved under its node as a copy, so a second
+  # concept inside it is no longer part of the tree and isn't marked.
+  t1[:] = [conType1, deepcopy(t1)]
+  t2[:] = [conType2, t2[:]]
 
   return out
 
 def suffix(tree, conStart1, conEnd1, conType1,
-                 conStart2, conEnd2, conType2):
+                 conStart2, conEnd2, conType2, index=None):
   """
     Suffixes the label in front of every node in the subtree.
+    index is the span index of the tree (see indexSpans).
+    Returns an enriched copy of the smallest subtree with both concepts,
+    the given tree is left unchanged.
     >>> suffix(createTree(test0), 1, 1, 'IS', 3, 4, 'TEST')
     ['VP', ['VBZ-IS', 'is'], ['NP-TEST', ['DT-TEST', 'a'], ['NN-TEST', 'test'], ['NN-TEST', 'sentence']]]
     >>> suffix(createTree(test8), 0, 1, 'PROBLEM1', 3, 4, 'PROBLEM2')
     ['S', ['OO-PROBLEM1', ['JJ-PROBLEM1', 'medical'], ['NN-PROBLEM1', 'problem']], ['VP', ['VBD', 'indicated'], ['NP', ['NP-PROBLEM2', ['JJ-PROBLEM2', 'medical'], ['NN-PROBLEM2', 'problem']], [':', ';'], ['SBAR', ['WHNP', ['WDT', 'which']], ['S', ['VP', ['VBZ', 'is'], ['ADJP', ['RB', 'really'], ['JJ', 'important']]]]]]], ['.', '.']]
   """
-  out = spt(tree, conStart1, conEnd2)
-  t1  = spt(tree, conStart1, conEnd1)
-  t2  = spt(tree, conStart2, conEnd2)
+  if index == None:
+    index = indexSpans(tree)
+
+  out = spt(tree, conStart1, conEnd2, index)
+  t1  = spt(tree, conStart1, conEnd1, index)
+  t2  = spt(tree, conStart2, conEnd2, index)
+  out, t1, t2 = _copy(out, t1, t2)
 
   # Suffix
   _suffix(t1, conType1)
@@ -163,6 +255,26 @@ def suffix(tree, conStart1, conEnd1, conType1,
   
   return out
 
+def _copy(tree, *nodes):
+  """
+    Helper for insert and suffix, copies the tree so it can be enriched
+    without changing the original. Returns the copy, followed by the
+    copies of the given nodes of the tree.
+    >>> t = createTree(test0)
+    >>> c, vp = _copy(t, t[2])
+    >>> c == t, c is t, vp is c[2]
+    (True, False, True)
+  """
+  memo = dict()
+  out = [deepcopy(tree, memo)]
+  for n in nodes:
+    if id(n) in memo:
+      out.append(memo[id(n)])
+    else:
+      # Not part of the tree, it won't show in the output.
+      out.append(deepcopy(n))
+  return out
+
 def _suffix(t, conType):
   """
     Helper for suffix, adds string to each label.
@@ -188,6 +300,14 @@ if __name__ == '__main__':
   test9 = '(NP (NP (NP (DT The) (JJ great) (NNS tests)) (VP (VBD conducted) (S (VP (TO to) (VP (VB investigate) (NP (JJ medical) (NN problem)))))) (. .)) (NNP VOID))'
   test10 = '(FRAG (NP (JJ Medical) (NN problem) (VBN indicated) (JJ medical) (NN problem)) (: ;) (SBAR (WHNP (WDT which)) (S (VP (VBZ is) (ADJP (RB really) (JJ important))))) (. .) (NP (NNP VOID)))'
   test11 = '(S (NP (DT This) (NN treatment)) (VP (VBZ improves) (NP (JJ medical) (NN problem) (. .) (NNP VOID))))'
+
+  import sys
+  if len(sys.argv) > 1:
+    # Benchmark tree reading on the given parse file
+    for name, secs in benchmark(sys.argv[1]):
+      print "%6s: %.4fs" % (name, secs)
+    sys.exit()
+
   import doctest
   doctest.testmod()
 
@@ -0,0 +1,283 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : workqueue.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Work queue on a shared directory, to spread the documents of a
+           run (see model.mapDocs) over processes on any number of hosts.
+           The coordinator splits the tasks into shards, pickled in
+           pending/. A worker claims a shard by renaming it into claimed/,
+           which only one can do, and keeps its lease by touching the
+           claimed file while it works. Results are written to done/.
+           Leases not touched for a while (i.e. the worker crashed) are put
+           back in pending/ for another worker. A shard may then be
+           processed twice, which gives the same results.
+           The coordinator gives the results in the order of the tasks.
+           A task that fails is given to the coordinator as a TaskError,
+           so one bad task doesn't stop every worker that claims its shard.
+           Workers use the document cache of the coordinator (see
+           note.setCache), which is kept with the queue.
+
+           Workers are started on each host with:
+           python workqueue.py work QUEUE_DIR
+
+"""
+
+import os
+import sys
+import time
+import glob
+import socket
+import shutil
+import cPickle
+import threading
+import traceback
+import subprocess
+
+def absPath(path):
+  """ Return absolute path from where this file is located """
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+class TaskError(Exception):
+  """ A task failed in a worker, with the worker's traceback. """
+
+# Seconds between touches of a lease, and after which it is stale.
+HEARTBEAT = 10.0
+LEASE     = 60.0
+
+def shardName(i):
+  """
+    >>> shardName(12)
+    '000012'
+  """
+  return '%06d' % i
+
+def _write(path, data):
+  """
+    Pickles data to path, whole or not at all: readers never see part of it.
+  """
+  tmp = os.path.join(os.path.dirname(path),
+                     '.%s.%s.tmp' % (os.path.basename(path), workerId()))
+  with open(tmp, 'wb') as f:
+    cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+  os.rename(tmp, path)
+
+def _read(path):
+  with open(path, 'rb') as f:
+    return cPickle.load(f)
+
+def _names(path):
+  """ Names of the shards in a directory, leaving out partial writes. """
+  return sorted(n for n in os.listdir(path) if not n.startswith('.'))
+
+def workerId():
+  return '%s.%d' % (socket.gethostname(), os.getpid())
+
+def submit(path, func, tasks, size=10, cache=None):
+  """
+    Creates a queue of the tasks in path, in shards of size tasks, each to
+    be applied func. func must be picklable (i.e. a module level function).
+    cache is the directory of the document cache workers use, if any.
+    Returns the number of shards.
+  """
+  for sub in ('pending', 'claimed', 'done'):
+    os.makedirs(os.path.join(path, sub))
+  # Before the shards, so workers read it once they claim one.
+  _write(os.path.join(path, 'cache'), cache and os.path.abspath(cache))
+
+  n = 0
+  for start in range(0, len(tasks), size):
+    _write(os.path.join(path, 'pending', shardName(n)),
+           (func, tasks[start:start + size]))
+    n += 1
+  with open(os.path.join(path, 'shards'), 'w') as f:
+    f.write('%d\n' % n)
+  return n
+
+def reclaim(path, lease=LEASE):
+  """
+    Puts the shards whose lease is older than lease seconds back in pending.
+    Returns their names.
+  """
+  out = list()
+  now = time.time()
+  for claim in glob.glob(os.path.join(path, 'claimed', '*')):
+    shard = os.path.basename(claim).split('.')[0]
+    try:
+      if now - os.path.getmtime(claim) < lease:
+        continue
+      os.rename(claim, os.path.join(path, 'pending', shard))
+    except OSError:
+      # Finished or reclaimed meanwhile.
+      continue
+    out.append(shard)
+  return out
+
+def claim(path):
+  """
+    Claims a pending shard, returns the path of its lease or None if there
+    is none left.
+  """
+  me = workerId()
+  for shard in _names(os.path.join(path, 'pending')):
+    lease = os.path.join(path, 'claimed', '%s.%s' % (shard, me))
+    try:
+      os.rename(os.path.join(path, 'pending', shard), lease)
+    except OSError:
+      # Another worker got it first.
+      continue
+    # Renaming keeps the time of the shard, the lease starts now.
+    os.utime(lease, None)
+    return lease
+  return None
+
+def _heartbeat(lease, stop, interval):
+  """
+    Helper for process, touches the lease until stop is set.
+  """
+  while not stop.wait(interval):
+    try:
+      os.utime(lease, None)
+    except OSError:
+      # Lease lost, the results are still written.
+      return
+
+def process(path, lease, heartbeat=HEARTBEAT):
+  """
+    Applies the function of a claimed shard to its tasks and writes their
+    results to done.
+  """
+  shard = os.path.basename(lease).split('.')[0]
+  stop = threading.Event()
+  beat = threading.Thread(target=_heartbeat, args=(lease, stop, heartbeat))
+  beat.daemon = True
+  beat.start()
+  try:
+    func, tasks = _read(lease)
+    results = list()
+    for task in tasks:
+      try:
+        results.append(func(task))
+      except Exception:
+        results.append(TaskError('Task failed in %s:\n%s'
+                                 % (workerId(), traceback.format_exc().strip())))
+    _write(os.path.join(path, 'done', shard), results)
+  finally:
+    stop.set()
+    beat.join()
+  try:
+    os.remove(lease)
+  except OSError:
+    pass
+
+def finished(path):
+  """
+    True once every shard has its results, or the queue is gone.
+  """
+  try:
+    with open(os.path.join(path, 'shards'), 'r') as f:
+      n = int(f.read())
+    return len(_names(os.path.join(path, 'done'))) >= n
+  except (IOError, OSError, ValueError):
+    return not os.path.exists(path)
+
+def work(path, poll=1.0, heartbeat=HEARTBEAT, lease=LEASE):
+  """
+    Processes shards of the queue until it is finished.
+    Returns the number of shards processed.
+  """
+  n = 0
+  while not finished(path):
+    try:
+      reclaim(path, lease)
+      l = claim(path)
+    except OSError:
+      # The queue was removed.
+      break
+    if l == None:
+      time.sleep(poll)
+      continue
+    if n == 0:
+      _useCache(path)
+    process(path, l, heartbeat)
+    n += 1
+  return n
+
+def _useCache(path):
+  """
+    Helper for work, sets the document cache the queue was submitted with.
+  """
+  # Imported here, as src is only on the path of workers.
+  import note
+  try:
+    note.setCache(_read(os.path.join(path, 'cache')))
+  except (IOError, OSError):
+    # The queue was removed.
+    note.setCache(None)
+
+def start(path, workers):
+  """
+    Starts workers on this host, returns their processes.
+  """
+  return [subprocess.Popen([sys.executable, absPath('workqueue.py'),
+                            'work', path])
+          for i in range(workers)]
+
+def results(path, procs=(), poll=0.5, lease=LEASE):
+  """
+    Yields the results of the queue's tasks in order, as their shards are
+    done. Stale leases are reclaimed meanwhile. Raises the TaskError of a
+    task that failed, or RuntimeError if all the given local workers stop
+    with work left, and no other worker is known to be running.
+    >>> import tempfile
+    >>> q = os.path.join(tempfile.mkdtemp(), 'queue')
+    >>> submit(q, abs, range(-5, 0), size=2)
+    3
+    >>> list(results(q, start(q, 2)))
+    [5, 4, 3, 2, 1]
+    >>> shutil.rmtree(os.path.dirname(q))
+    >>> submit(q, abs, [-1, 'a', -3], size=2)
+    2
+    >>> list(results(q, start(q, 1)))  # doctest: +ELLIPSIS
+    Traceback (most recent call last):
+      ...
+    TaskError: Task failed in ...
+    TypeError: bad operand type for abs(): 'str'
+    >>> os.listdir(os.path.join(q, 'done'))
+    ['000000', '000001']
+    >>> shutil.rmtree(os.path.dirname(q))
+  """
+  with open(os.path.join(path, 'shards'), 'r') as f:
+    n = int(f.read())
+  for i in range(n):
+    done = os.path.join(path, 'done', shardName(i))
+    while not os.path.exists(done):
+      reclaim(path, lease)
+      if procs and all(p.poll() != None for p in procs) and \
+         not os.listdir(os.path.join(path, 'claimed')):
+        raise RuntimeError('Workers stopped with shards left in %s.' % path)
+      time.sleep(poll)
+    for out in _read(done):
+      if isinstance(out, TaskError):
+        raise out
+      yield out
+
+if __name__ == '__main__':
+  if sys.argv[1:2] == ['work'] and len(sys.argv) == 3:
+    # Shards refer to the functions of model.py and the modules it uses.
+    sys.path.insert(0, absPath('.'))
+    sys.path.insert(1, absPath('../../src'))
+    # Through the module, so its TaskErrors unpickle in the coordinator.
+    import workqueue
+    workqueue.work(sys.argv[2])
+  elif len(sys.argv) == 1:
+    import doctest
+    import workqueue
+    doctest.testmod(workqueue)
+  else:
+    print "USAGE: python workqueue.py work QUEUE_DIR"
+    sys.exit(1)
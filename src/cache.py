@@ -0,0 +1,181 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : cache.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Persistent on-disk cache of document tables.
+           Each table is stored column by column in a numpy archive, named by
+           a key built from the files the table was created from. Changing a
+           file, or the code that builds the table (see CACHE_VERSION),
+           changes its key, so stale entries are never read again; they are
+           evicted, least recently used first, once the cache is full.
+
+"""
+
+import os
+import hashlib
+import numpy as np
+from pandas import DataFrame
+
+# Version of the tables in the cache, part of every key. Bump it whenever
+# the code that builds cached tables changes their content, so tables built
+# by earlier versions are not read again.
+CACHE_VERSION = 1
+
+class DiskCache(object):
+  """
+    Stores DataFrames (or None) in a directory, up to maxSize bytes.
+
+    >>> import tempfile
+    >>> c = DiskCache(tempfile.mkdtemp())
+    >>> k = c.key('example', [__file__])
+    >>> c.fetch(k, lambda: DataFrame({'a': [1, 2], 'b': ['x', np.nan]}))
+       a    b
+    0  1    x
+    1  2  NaN
+    >>> c.fetch(k, lambda: None)
+       a    b
+    0  1    x
+    1  2  NaN
+    >>> (c.hits, c.misses)
+    (1, 1)
+  """
+
+  def __init__(self, path, maxSize=2**30):
+    self.path    = path
+    self.maxSize = maxSize
+    self.hits    = 0
+    self.misses  = 0
+
+    if not os.path.isdir(path):
+      os.makedirs(path)
+
+    self.size = sum(os.path.getsize(f) for f in self._entries())
+
+  def key(self, name, files, extra=(), content=False):
+    """
+      Returns the key of a table built by name from the given files.
+      Files are identified by path, size and modification time, or by
+      their content if content is set (so copied or touched files still
+      match). Keys also depend on CACHE_VERSION.
+    """
+    h = hashlib.sha1('%s\0%d\0' % (name, CACHE_VERSION))
+    for f in files:
+      if content:
+        with open(f, 'rb') as data:
+          for block in iter(lambda: data.read(2**20), ''):
+            h.update(block)
+        h.update('\0')
+        continue
+      s = os.stat(f)
+      h.update('%s\0%d\0%r\0' % (os.path.abspath(f), s.st_size, s.st_mtime))
+    for e in extra:
+      h.update(repr(e) + '\0')
+    return h.hexdigest()
+
+  def fetch(self, key, build):
+    """
+      Returns the table stored under key. If there is none, it is created
+      with build() and stored.
+    """
+    f_name = os.path.join(self.path, key + '.npz')
+    if os.path.exists(f_name):
+      try:
+        out = self._load(f_name)
+        # Mark as recently used
+        os.utime(f_name, None)
+        self.hits += 1
+        return out
+      except (IOError, ValueError, KeyError):
+        # Unreadable entry (i.e. partially written), rebuild it.
+        pass
+
+    self.misses += 1
+    out = build()
+    try:
+      self._store(f_name, out)
+    except ValueError:
+      # Table has columns that can not be stored, don't cache it.
+      pass
+    return out
+
+  def _entries(self):
+    return [os.path.join(self.path, f) for f in os.listdir(self.path)
+                                       if f.endswith('.npz')]
+
+  def _load(self, f_name):
+    with np.load(f_name) as data:
+      if 'none' in data.files:
+        return None
+      out = DataFrame()
+      for i, name in enumerate(data['columns']):
+        col = data['c%d' % i]
+        if 'u%d' % i in data.files:
+          col = data['u%d' % i][col]
+        if 'n%d' % i in data.files:
+          col = col.astype(object)
+          col[data['n%d' % i]] = np.nan
+        out[name] = col
+    return out
+
+  def _store(self, f_name, table):
+    data = dict()
+    if type(table) == type(None):
+      data['none'] = np.array([])
+    else:
+      data['columns'] = np.array([str(c) for c in table.columns])
+      for i, name in enumerate(table.columns):
+        col = table[name].values
+        if col.dtype == object:
+          null = np.array([type(v) == float and np.isnan(v) for v in col],
+                          dtype=bool)
+          data['n%d' % i] = null
+          kinds = set(type(v) for v in col[~null])
+          if kinds <= set([bool, np.bool_]):
+            # i.e. flags of pairs missing from an outer merge
+            col = np.array([n or v for v, n in zip(col, null)], dtype=bool)
+          elif kinds <= set([str]):
+            # Each distinct string is stored once, rows refer to it.
+            strings = np.array(['' if n else v for v, n in zip(col, null)])
+            data['u%d' % i], col = np.unique(strings, return_inverse=True)
+            col = col.astype(np.int32)
+          else:
+            raise ValueError('Can not store column %s.' % name)
+        data['c%d' % i] = col
+
+    # Write to a temporary file first so readers never see partial entries.
+    tmp = '%s.%d.tmp' % (f_name, os.getpid())
+    with open(tmp, 'wb') as f:
+      np.savez(f, **data)
+    os.rename(tmp, f_name)
+
+    self.size += os.path.getsize(f_name)
+    if self.size > self.maxSize:
+      self.evict()
+
+  def evict(self):
+    """
+      Removes the least recently used entries until the cache fits in
+      maxSize.
+    """
+    entries = [(os.path.getmtime(f), os.path.getsize(f), f)
+               for f in self._entries()]
+    entries.sort()
+
+    self.size = sum(e[1] for e in entries)
+    for _, size, f in entries:
+      if self.size <= self.maxSize:
+        break
+      try:
+        os.remove(f)
+      except OSError:
+        pass
+      self.size -= size
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod()
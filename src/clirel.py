@@ -13,16 +13,42 @@
 
 import os
 import sys
-import sklearn.metrics as metrics
-import numpy as np
-from collections import defaultdict
+import time
+from itertools import izip
+from collections import Counter
 
-import note
+import instrument
+
+# numpy, pandas (through note) and sklearn take most of the start up time,
+# so they are imported by the functions that need them. Keep the imports of
+# each command to what it uses, see bench/imports.py.
 
 def absPath(path):
   """ Return absolute path from where this file is located """
   return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
 
+# Parsed documents are cached here between runs. The CLIREL_CACHE environment
+# variable sets another directory, or disables the cache if empty.
+CACHE_DIR = os.environ.get('CLIREL_CACHE', absPath('../cache'))
+
+# Each run writes its stage timings (see instrument.py) here, as
+# <command>.json. Set by the CLIREL_REPORTS environment variable.
+REPORT_DIR = os.environ.get('CLIREL_REPORTS', absPath('../reports'))
+
+def loadModel(model_path):
+  """
+    Imports the model of model_path.
+    The model will be loaded as a module. This provides modularity for the
+    assumption that the model is implemented with a 'model.py' in its main
+    dir. The dir is then kept on sys.path, after the other paths, as models
+    may import their other modules only when they need them.
+  """
+  sys.path.insert(0, model_path)
+  import model
+  sys.path.remove(model_path)
+  sys.path.append(model_path)
+  return model
+
 def train(t_dir, model_path, model_flags=None):
   """
     >>> train('i2b2_examples/', 'model_example/')
@@ -30,6 +56,7 @@ def train(t_dir, model_path, model_flags=None):
     >>> train('i2b2_examples/', 'model_example/', ['a', 'b'])
     'Example model success with flags a b.'
   """
+  import note
   cons = note.filterFiles(os.path.join(t_dir, 'concept'), 'con')
   txts = note.filterFiles(os.path.join(t_dir,     'txt'), 'txt')
   rels = note.filterFiles(os.path.join(t_dir,     'rel'), 'rel')
@@ -39,12 +66,7 @@ def train(t_dir, model_path, model_flags=None):
   for c,t,r in zip(cons, txts, rels):
     data.append((c, t, r))
 
-  # import the model.
-  # The model will be loaded as a module. This provides modularity for the
-  # assumption that the model is implemented with a 'model.py' in its main dir.
-  sys.path.insert(0, model_path)
-  import model
-  sys.path = sys.path[1:]
+  model = loadModel(model_path)
 
   out = model.train(data, model_flags)
   del model
@@ -53,6 +75,7 @@ def train(t_dir, model_path, model_flags=None):
 
 
 def predict(t_dir, model_path, model_flags=None):
+  import note
 
   cons = note.filterFiles(os.path.join(t_dir, 'concept'), 'con')
   txts = note.filterFiles(os.path.join(t_dir,     'txt'), 'txt')
@@ -65,12 +88,7 @@ def predict(t_dir, model_path, model_flags=None):
   for f in note.filterFiles(absPath('../predictions'), 'pred'):
     os.remove(f)
 
-  # import the model.
-  # The model will be loaded as a module. This provides modularity for the
-  # assumption that the model is implemented with a 'model.py' in its main dir.
-  sys.path.insert(0, model_path)
-  import model
-  sys.path = sys.path[1:]
+  model = loadModel(model_path)
 
   out = model.predict(data, model_flags)
 
@@ -78,85 +96,209 @@ def predict(t_dir, model_path, model_flags=None):
 
   return out
 
-def evaluate(e_dir, p_dir):
+def readDocs(f):
   """
-    Extracts the relation files from the gold directory and the
-    prediciton directory, and calculates the F1, recall, and precision.
+    Yields the (concept file, text file) of each document named on a line
+    of f, as "<concept file> <text file>". Blank lines are skipped.
+    >>> import StringIO
+    >>> list(readDocs(StringIO.StringIO('a.con a.txt\\n\\nb.con b.txt\\n')))
+    [('a.con', 'a.txt'), ('b.con', 'b.txt')]
   """
+  for line in iter(f.readline, ''):
+    fields = line.split()
+    if len(fields) == 0:
+      continue
+    if len(fields) != 2:
+      print >> sys.stderr, "Skipping invalid line: %s" % line.strip()
+      continue
+    yield fields[0], fields[1]
 
-  c_files = note.filterFiles(os.path.join(e_dir, 'concept'), 'con')
-  t_files = note.filterFiles(os.path.join(e_dir,     'txt'), 'txt')
-  g_files = note.filterFiles(os.path.join(e_dir,     'rel'), 'rel')
-  p_files = note.filterFiles(p_dir, 'pred')
+def watchDocs(d, poll=0.5):
+  """
+    Yields the (concept file, text file) of each document that appears in
+    the concept and txt directories of d, and again whenever one of its
+    files changes. A document is given once its files have stopped
+    changing for one poll (seconds), so partly written files are not read.
+  """
+  import note
+  seen    = dict()
+  pending = dict()
+  while True:
+    for c in note.filterFiles(os.path.join(d, 'concept'), 'con'):
+      name = note.docName(c)
+      t = os.path.join(d, 'txt', name + '.txt')
+      try:
+        sig = [(s.st_size, s.st_mtime) for s in map(os.stat, [c, t])]
+      except OSError:
+        continue
+      if seen.get(name) == sig:
+        continue
+      if pending.get(name) == sig:
+        seen[name] = sig
+        del pending[name]
+        yield c, t
+      else:
+        pending[name] = sig
+    time.sleep(poll)
 
-  def ugh():
-    return np.nan
+def stream(source, model_path, model_flags=None):
+  """
+    Predicts documents as they arrive, from stdin (source '-', see readDocs)
+    or from a watched data directory (see watchDocs), and prints the
+    prediction file and latency of each as soon as it is written.
+    Predictions of other documents are kept. Documents that fail are
+    reported on stderr, and the stream goes on.
+    Models may define stream(data, flags), yielding the name of each
+    document once predicted; otherwise predict is called per document.
+  """
+  import note
+  arrived = dict()
+  def arrivals(docs):
+    for c, t in docs:
+      arrived[note.docName(t)] = time.time()
+      yield c, t
+
+  if source == '-':
+    docs = arrivals(readDocs(sys.stdin))
+  else:
+    docs = arrivals(watchDocs(source))
+
+  model = loadModel(model_path)
+
+  def predictEach(docs):
+    for d in docs:
+      try:
+        out = model.predict([d], model_flags)
+      except Exception as e:
+        # Keep going, later documents are still predicted.
+        out = 'Skipping %s: %s: %s' % (note.docName(d[1]),
+                                       type(e).__name__, e)
+      if out:
+        print >> sys.stderr, out
+        continue
+      yield note.docName(d[1])
+
+  if hasattr(model, 'stream'):
+    names = model.stream(docs, model_flags)
+  else:
+    names = predictEach(docs)
 
-  gold = defaultdict(ugh)
-  pred = defaultdict(ugh)
+  for name in names:
+    latency = time.time() - arrived.pop(name, time.time())
+    print "%s\t%.0f ms" % (os.path.join(absPath('../predictions'),
+                                        name + '.pred'), latency * 1000)
+    sys.stdout.flush()
 
-  def addGold(d):
-    ind = [int(d.conStart1), int(d.conEnd1), int(d.conStart2), int(d.conEnd2)]
-    ind.append(d.lineNum)
-    ind.append(d.fileName)
+def useCache(path):
+  """ Sets the cache of document tables, see note.setCache. """
+  import note
+  note.setCache(path)
 
-    ind.append(d.conType1)
-    ind.append(d.conType2)
-    gold[tuple(ind)] = d.relType
+# Concept types, coded as integers in relation tables.
+_TYPES = ['test', 'treatment', 'problem']
 
-  def addPred(d):
-    ind = [int(d.conStart1), int(d.conEnd1), int(d.conStart2), int(d.conEnd2)]
-    ind.append(d.lineNum)
-    ind.append(d.fileName)
+# Columns that identify a concept pair within a document.
+_KEYS = ['lineNum', 'conStart1', 'conEnd1', 'conStart2', 'conEnd2',
+         'type1', 'type2']
 
-    ind.append(d.conType1)
-    ind.append(d.conType2)
+def relTable(data):
+  """
+    Takes a document table (see note.createTraining) and returns its
+    concept pairs, keyed by integer columns, and their relation labels.
+    Unknown concept types are coded as -1.
+  """
+  import numpy as np
+  from pandas import DataFrame
+
+  out = DataFrame(dict((k, data[k].values.astype(np.int64))
+                       for k in _KEYS[:5]))
+  codes = dict((c, i) for i, c in enumerate(_TYPES))
+  for i in ['1', '2']:
+    t = data['conType' + i].map(codes).fillna(-1)
+    out['type' + i] = t.values.astype(np.int64)
+  out['relType'] = data['relType'].values
+  # Later entries of a pair replace earlier ones.
+  return out.drop_duplicates(_KEYS, keep='last')
+
+def negLabel(type1, type2):
+  """
+    Returns the negative labels of concept pairs with the given type codes.
+    >>> import numpy as np
+    >>> list(negLabel(np.array([1, 0]), np.array([2, 2])))
+    ['NTRPR', 'NTEPR']
+  """
+  import numpy as np
+  names = np.array([c[:2].upper() for c in _TYPES] + [''], dtype=object)
+  return 'N' + names[type1] + names[type2]
 
-    pred[tuple(ind)] = d.relType
+def compare(gold, pred):
+  """
+    Joins the gold and predicted relation tables of a document (see
+    relTable). Returns the detection counts (TP, FP, FN, TN) and the gold
+    and predicted labels of the gold relations.
+  """
+  import numpy as np
+  import pandas as pd
 
+  gold = gold.assign(inGold=True)
+  pred = pred.assign(inPred=True)
+  m = pd.merge(gold, pred, how='outer', on=_KEYS, sort=True,
+               suffixes=('Gold', 'Pred'))
 
-  for c, t, g in zip(c_files, t_files, g_files):
-    #print c.split('/')[-1].split('.')[0], t.split('/')[-1].split('.')[0], g.split('/')[-1].split('.')[0]
-    assert c.split('/')[-1].split('.')[0] == t.split('/')[-1].split('.')[0] == g.split('/')[-1].split('.')[0]
-    data = note.createTraining(c, t, g)
-    if type(data) == type(None):
-      continue
-    data.apply(addGold, axis=1)
+  neg = negLabel(m['type1'].values, m['type2'].values)
+  g = m['relTypeGold'].values
+  p = m['relTypePred'].values
+  g = np.where([type(v) == str for v in g], g, neg)
 
-  for c, t, p in zip(c_files, t_files, p_files):
-    #print c.split('/')[-1].split('.')[0], t.split('/')[-1].split('.')[0], p.split('/')[-1].split('.')[0]
-    assert c.split('/')[-1].split('.')[0] == t.split('/')[-1].split('.')[0] == p.split('/')[-1].split('.')[0]
-    data = note.createTraining(c, t, p)
-    if type(data) == type(None):
-      continue
-    data.apply(addPred, axis=1)
+  predicted = np.array([type(v) == str for v in p], dtype=bool)
+  positive  = np.array([v[0] != 'N' for v in g], dtype=bool)
+
+  counts = (int(( positive &  predicted).sum()),
+            int((~positive & ~predicted).sum()),
+            int(( positive & ~predicted).sum()),
+            int((~positive &  predicted).sum()))
+
+  g_labels = g[positive]
+  p_labels = np.where(predicted, p, neg)[positive]
+  return counts, list(g_labels), list(p_labels)
+
+def evaluate(e_dir, p_dir):
+  """
+    Extracts the relation files from the gold directory and the
+    prediciton directory, and calculates the F1, recall, and precision.
+    Documents are compared one at a time.
+  """
+  import sklearn.metrics as metrics
+  import note
+
+  c_dir = os.path.join(e_dir, 'concept')
+  t_dir = os.path.join(e_dir,     'txt')
+  g_dir = os.path.join(e_dir,     'rel')
 
   TP = 0
   FP = 0
   FN = 0
   TN = 0
 
+  # Gold and predicted label pairs of the gold relations, with their counts.
+  labelPairs = Counter()
+
+  # Both skip the same documents, those without concept pairs.
+  for gold, pred in izip(note.iterEntries(c_dir, t_dir, g_dir),
+                         note.iterEntries(c_dir, t_dir, p_dir, 'pred')):
+    with instrument.stage('evaluate', len(gold)):
+      (tp, fp, fn, tn), g, p = compare(relTable(gold), relTable(pred))
+    TP += tp
+    FP += fp
+    FN += fn
+    TN += tn
+    labelPairs.update(zip(g, p))
+
   g_labels = list()
   p_labels = list()
-  for p in pred.keys():
-    if type(gold[p]) != str:
-      gold[p] = 'N%s%s' % (p[-2][:2].upper(), p[-1][:2].upper())
-
-  for g in gold.keys():
-    if type(pred[g]) != str:
-      if gold[g][0] != "N":
-        p_labels.append('N%s%s' % (g[-2][:2].upper(), g[-1][:2].upper()))
-        g_labels.append(gold[g])
-        FN += 1
-      else:
-        FP += 1
-    else:
-      if gold[g][0] != "N":
-        p_labels.append(pred[g])
-        g_labels.append(gold[g])
-        TP += 1
-      else:
-        TN += 1
+  for (g, p), n in sorted(labelPairs.items()):
+    g_labels.extend([g] * n)
+    p_labels.extend([p] * n)
 
   if (TP + FP):
     P = float(TP) / (TP + FP)
@@ -214,6 +356,8 @@ if __name__ == '__main__':
 
   if (len(sys.argv) < 2):
     print "USAGE: clirel train|test|eval data_dir [model|pred_dir] [options]"
+    print "       clirel stream -|data_dir model [options]"
+    print "       clirel serve model [--port N] [options]"
     sys.exit(1)
 
   if (sys.argv[1] == "train"):
@@ -226,6 +370,7 @@ if __name__ == '__main__':
       print "USAGE: clirel train data_dir model options"
       sys.exit(1)
     print "Training..."
+    useCache(CACHE_DIR)
     train(t_dir, model, opts)
   elif (sys.argv[1] == "test"):
     try:
@@ -237,6 +382,7 @@ if __name__ == '__main__':
       print "USAGE: clirel test data_dir model options"
       sys.exit(1)
     print "Predicting..."
+    useCache(CACHE_DIR)
     predict(t_dir, model, opts)
   elif (sys.argv[1] == "eval"):
     try:
@@ -247,7 +393,48 @@ if __name__ == '__main__':
       print "USAGE: clirel eval data_dir pred_dir"
       sys.exit(1)
     print "Evaluating..."
+    useCache(CACHE_DIR)
     evaluate(e_dir, pred)
+  elif (sys.argv[1] == "stream"):
+    try:
+      source = sys.argv[2]
+      model  = sys.argv[3]
+      opts   = sys.argv[4:]
+    except:
+      print "Invalid arguments"
+      print "USAGE: clirel stream -|data_dir model options"
+      sys.exit(1)
+    print >> sys.stderr, "Streaming..."
+    useCache(CACHE_DIR)
+    try:
+      stream(source, model, opts)
+    except KeyboardInterrupt:
+      pass
+  elif (sys.argv[1] == "serve"):
+    try:
+      model = sys.argv[2]
+      opts  = sys.argv[3:]
+      port  = 8642
+      if '--port' in opts:
+        i = opts.index('--port')
+        port = int(opts[i + 1])
+        opts = opts[:i] + opts[i + 2:]
+    except:
+      print "Invalid arguments"
+      print "USAGE: clirel serve model [--port N] options"
+      sys.exit(1)
+    import server
+    useCache(CACHE_DIR)
+    server.serve(model, opts, port)
   else:
     print "USAGE: clirel train|test|eval data_dir [model|pred_dir] [options]"
+    print "       clirel stream -|data_dir model [options]"
+    print "       clirel serve model [--port N] [options]"
     sys.exit(1)
+
+  instrument.summary(sys.stderr if sys.argv[1] == 'stream' else None)
+  if REPORT_DIR:
+    if not os.path.isdir(REPORT_DIR):
+      os.makedirs(REPORT_DIR)
+    instrument.report(os.path.join(REPORT_DIR, sys.argv[1] + '.json'),
+                      command=sys.argv[1:])
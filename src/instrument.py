@@ -0,0 +1,227 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : instrument.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Stage level timing and counters for clirel and the models.
+           Each stage (loading, pairing, negatives, parse merge, ...)
+           accumulates its wall time, the rows it processed, how often it
+           ran and the peak memory of the process when it ended. Stages may
+           be nested, their times are inclusive.
+           Long loops report their throughput and time left with Progress,
+           and the stages are written as JSON at the end of a run by
+           report().
+
+"""
+
+import sys
+import json
+import time
+import resource
+from functools import wraps
+from contextlib import contextmanager
+
+# Stages of this process, by name, in the order they first ran.
+_stages = dict()
+_order  = list()
+_start  = time.time()
+
+class Stage(object):
+  """
+    Counters of a stage. Add to rows as they are processed.
+  """
+  __slots__ = ('name', 'seconds', 'rows', 'calls', 'peakMB')
+
+  def __init__(self, name):
+    self.name    = name
+    self.seconds = 0.0
+    self.rows    = 0
+    self.calls   = 0
+    self.peakMB  = 0.0
+
+  def asDict(self):
+    return {'seconds': self.seconds, 'rows': self.rows,
+            'calls': self.calls, 'peakMB': self.peakMB}
+
+def get(name):
+  """
+    Returns the counters of a stage, creating them if needed.
+  """
+  if name not in _stages:
+    _stages[name] = Stage(name)
+    _order.append(name)
+  return _stages[name]
+
+def find(name):
+  """
+    Returns the counters of a stage, or None if it hasn't run.
+  """
+  return _stages.get(name)
+
+def peakMB():
+  """
+    Peak resident memory of this process, or of its finished children
+    (i.e. svm_learn) if larger, in MB.
+  """
+  rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+  # Linux gives kilobytes, OS X bytes.
+  if sys.platform == 'darwin':
+    rss /= 1024
+  return rss / 1024.0
+
+@contextmanager
+def stage(name, rows=0):
+  """
+    Times the body of a with statement as a run of the named stage.
+    Rows may be given, or added to the stage given by the with statement.
+    >>> reset()
+    >>> with stage('pairing', 3) as s:
+    ...   s.rows += 2
+    >>> get('pairing').rows, get('pairing').calls
+    (5, 1)
+  """
+  s = get(name)
+  s.rows  += rows
+  s.calls += 1
+  start = time.time()
+  try:
+    yield s
+  finally:
+    s.seconds += time.time() - start
+    s.peakMB = max(s.peakMB, peakMB())
+
+def timed(name):
+  """
+    Decorator, runs each call of a function as a run of the named stage.
+  """
+  def decorator(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+      with stage(name):
+        return func(*args, **kwargs)
+    return wrapper
+  return decorator
+
+def take():
+  """
+    Returns the counters of this process as a list and clears them, so
+    they can be sent to another process (see merge).
+  """
+  out = [(name, _stages[name].asDict()) for name in _order]
+  reset()
+  return out
+
+def merge(counters):
+  """
+    Adds counters taken in another process (i.e. a worker) to this one.
+    >>> reset()
+    >>> merge([('loading', {'seconds': 1.5, 'rows': 10, 'calls': 2,
+    ...                     'peakMB': 20.0})])
+    >>> get('loading').rows
+    10
+  """
+  for name, c in counters:
+    s = get(name)
+    s.seconds += c['seconds']
+    s.rows    += c['rows']
+    s.calls   += c['calls']
+    s.peakMB   = max(s.peakMB, c['peakMB'])
+
+def reset():
+  global _start
+  _stages.clear()
+  del _order[:]
+  _start = time.time()
+
+class collected(object):
+  """
+    Wraps a function run by a pool of processes (see kim's mapDocs), so each
+    call returns its result along with the counters of the worker, to be
+    merged in the parent.
+  """
+
+  def __init__(self, func):
+    self.func = func
+
+  def __call__(self, *args):
+    reset()
+    return self.func(*args), take()
+
+class Progress(object):
+  """
+    Reports the throughput and the time left of a loop over a known number
+    of items, at most every interval seconds.
+    >>> import StringIO
+    >>> out = StringIO.StringIO()
+    >>> p = Progress('documents', 4, interval=0, out=out)
+    >>> p.update(2)
+    >>> out.getvalue().split(',')[0]
+    '  documents: 2/4'
+  """
+
+  def __init__(self, name, total, interval=5.0, out=None):
+    self.name     = name
+    self.total    = total
+    self.interval = interval
+    self.out      = out
+    self.done     = 0
+    self.start    = time.time()
+    self.last     = self.start
+
+  def update(self, n=1):
+    self.done += n
+    now = time.time()
+    if now - self.last < self.interval and self.done < self.total:
+      return
+    self.last = now
+
+    rate = self.done / max(now - self.start, 1e-9)
+    left = (self.total - self.done) / rate if rate > 0 else 0
+    out = self.out if self.out != None else sys.stderr
+    out.write('  %s: %d/%d, %.1f/s, ETA %s\n' % (self.name, self.done,
+                                                 self.total, rate,
+                                                 _duration(left)))
+    out.flush()
+
+def _duration(seconds):
+  """
+    >>> _duration(3725)
+    '1:02:05'
+  """
+  m, s = divmod(int(seconds), 60)
+  h, m = divmod(m, 60)
+  return '%d:%02d:%02d' % (h, m, s)
+
+def summary(out=None):
+  """
+    Prints a table of the stages.
+  """
+  out = out if out != None else sys.stdout
+  out.write('%-16s %10s %10s %12s %10s\n' % ('Stage', 'Seconds', 'Rows',
+                                             'Rows/s', 'Peak MB'))
+  for name in _order:
+    s = _stages[name]
+    rate = s.rows / s.seconds if s.seconds > 0 else 0.0
+    out.write('%-16s %10.3f %10d %12.1f %10.1f\n' % (name, s.seconds, s.rows,
+                                                    rate, s.peakMB))
+
+def report(f_name, **info):
+  """
+    Writes the stages, and any other information given, as JSON.
+  """
+  data = dict(info)
+  data['seconds'] = time.time() - _start
+  data['peakMB']  = peakMB()
+  data['stages']  = [dict(_stages[name].asDict(), name=name)
+                     for name in _order]
+  with open(f_name, 'w') as f:
+    json.dump(data, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod()
@@ -13,11 +13,54 @@
 """
 
 import os
+import sys
 
 import re
 import numpy as np
 import pandas as pd
 from pandas import DataFrame, Series
+from collections import defaultdict
+from functools import wraps
+
+import cache
+import pairs
+import instrument
+
+# Cache of document tables, see setCache.
+_cache = None
+
+def setCache(path, maxSize=2**30):
+  """
+    Keeps the tables created from document files in an on-disk cache at
+    path, of at most maxSize bytes. No cache is used if path is None.
+  """
+  global _cache
+  if path:
+    _cache = cache.DiskCache(path, maxSize)
+  else:
+    _cache = None
+
+def cacheDir():
+  """ The directory of the cache set by setCache, or None. """
+  return _cache.path if _cache else None
+
+def cached(func, content=False):
+  """
+    Wraps a function that creates a table from document files, so that the
+    table is read from the cache (if one is set) while the files are
+    unchanged. Files are given as positional arguments, options as keywords.
+    Files are compared by content if content is set, else by their stat.
+  """
+  @wraps(func)
+  def wrapper(*files, **kwargs):
+    if _cache is None:
+      return func(*files, **kwargs)
+    key = _cache.key(func.__module__ + '.' + func.__name__,
+                     files,
+                     sorted(kwargs.items()),
+                     content)
+    return _cache.fetch(key, lambda: func(*files, **kwargs))
+  return wrapper
 
 def extractConsFromText(line):
   """
@@ -36,10 +79,124 @@ def extractConsFromText(line):
           int(m.group(3)), 
           int(m.group(4)), m.group(5), m.group(1))
 
-def extractCons(consFile):
+def pairCons(data, unordered=False):
+  """
+    Takes a list of concepts and yields every pair that shares a line.
+    Concepts are grouped by line first, so only concepts on the same line
+    are ever compared. By default both orders of each pair are given.
+    If unordered is set, each pair is given once, in the order the concepts
+    appear on the line.
+
+    >>> cons = [(1, 3, 4, 'problem', 'medical problem'),
+    ...         (1, 0, 1, 'treatment', 'This treatment'),
+    ...         (2, 0, 0, 'test', 'Test')]
+    >>> [(p[1], p[5]) for p in pairCons(cons)]
+    [(3, 0), (0, 3)]
+    >>> [(p[1], p[5]) for p in pairCons(cons, True)]
+    [(0, 3)]
+  """
+  lines = defaultdict(list)
+  for i, d in enumerate(data):
+    lines[d[0]].append(i)
+
+  for i, d1 in enumerate(data):
+    for j in lines[d1[0]]:
+      if i == j or (unordered and j < i):
+        continue
+      d2 = data[j]
+      if unordered and d1[1:3] > d2[1:3]:
+        yield d2 + d1[1:]
+      else:
+        yield d1 + d2[1:]
+
+class Pruning(object):
+  """
+    Rules removing concept pairs before their tables are built:
+    types     the pairs of concept types allowed, in either order.
+    distance  the most tokens allowed between the two concepts.
+    between   the most concepts allowed to start between the two concepts.
+    Rules left as None remove nothing. The pairs each rule removes, of
+    those the previous rules kept, are counted as 'pruned <rule>' stages
+    (see instrument.py), and all pairs considered as 'pruning'.
+
+    >>> cons = [(1, 0, 1, 'treatment', 'a'), (1, 3, 3, 'treatment', 'b'),
+    ...         (1, 9, 10, 'problem', 'c')]
+    >>> p = pairs.Pairs('h', cons, True)
+    >>> rules = Pruning([('problem', 'treatment')], distance=6)
+    >>> rules
+    Pruning(types=[('problem', 'treatment')], distance=6, between=None)
+    >>> [(x['conStart1'], x['conStart2']) for x in rules.apply(p).pairs]
+    [(3, 9)]
+  """
+  RULES = ['types', 'distance', 'between']
+
+  def __init__(self, types=None, distance=None, between=None):
+    self.types    = (sorted(set(tuple(sorted(t)) for t in types))
+                     if types != None else None)
+    self.distance = distance
+    self.between  = between
+
+  def __repr__(self):
+    # Part of the cache keys of the tables built with these rules.
+    return 'Pruning(types=%r, distance=%r, between=%r)' % (self.types,
+                                                          self.distance,
+                                                          self.between)
+
+  def keep(self, p, rule):
+    """ The pairs of p the rule keeps. """
+    if rule == 'types':
+      codes = [(pairs.typeCode(a), pairs.typeCode(b)) for a, b in self.types]
+      allowed = np.zeros((len(pairs.TYPES),) * 2, dtype=bool)
+      for a, b in codes:
+        allowed[a, b] = allowed[b, a] = True
+      return allowed[p.pairs['conType1'], p.pairs['conType2']]
+    if rule == 'distance':
+      return p.distance() <= self.distance
+    return p.between() <= self.between
+
+  def apply(self, p):
+    """ Removes the pairs of the store p the rules don't allow. """
+    with instrument.stage('pruning', len(p)):
+      for rule in self.RULES:
+        if getattr(self, rule) == None or len(p) == 0:
+          continue
+        keep = self.keep(p, rule)
+        instrument.get('pruned ' + rule).rows += int(len(keep) - keep.sum())
+        p.select(keep)
+    return p
+
+def pruneSummary(stages, out=None):
+  """
+    Prints the pairs each pruning rule removed, and an estimate of the time
+    it saved: the pairs removed, times the time per pair of the given stages
+    (i.e. those run on the pairs kept).
+  """
+  out = out if out != None else sys.stdout
+  if instrument.find('pruning') == None:
+    return
+  cost = 0.0
+  for name in stages:
+    s = instrument.find(name)
+    if s and s.rows > 0:
+      cost += s.seconds / s.rows
+  total = instrument.get('pruning').rows
+  out.write('Pruning: %d candidate pairs\n' % total)
+  for rule in Pruning.RULES:
+    s = instrument.find('pruned ' + rule)
+    if s == None:
+      continue
+    out.write('  %-10s removed %8d (%5.1f%%), saved ~%.3fs\n'
+              % (rule, s.rows, 100.0 * s.rows / max(total, 1),
+                 s.rows * cost))
+
+def extractCons(consFile, unordered=False, prune=None):
   """
     Takes a concept file and returns a panda datatable.
     Where every entry is a pair of concepts.
+    If unordered is set, each pair of concepts is only given once, and the
+    'swapped' column flags whether the pair is in the reverse of the order
+    the concepts appear on the line (see orientCons).
+    Pairs are removed by the rules of prune (see Pruning) if it is given.
 
     >>> print extractCons('./i2b2_examples/concept/health.con').ix[0]
     lineNum                    1
@@ -65,31 +222,53 @@ def extractCons(consFile):
     conText2     medical problem
     fileName              health
     Name: 1, dtype: object
+    >>> extractCons('./i2b2_examples/concept/health.con', True).shape
+    (11, 11)
   """
   data = list()
 
   with open(consFile, 'r') as f:
     for line in f:
       data.append(extractConsFromText(line))
-  out = list()
-  for i,d1 in enumerate(data):
-    for j,d2 in enumerate(data):
-      if d1[0] == d2[0] and i != j:
-        out.append(d1 + d2[1:])
+  # Pairs are made in a compact store (see pairs.py), as integers.
+  out = pairs.Pairs(docName(consFile), data, unordered)
+  if prune != None:
+    out = prune.apply(out)
   # No concept pairs
   if len(out) == 0:
     return None
-  out = DataFrame(out, columns = ["lineNum", 
-                                    "conStart1",
-                                    "conEnd1",
-                                    "conType1",
-                                    "conText1",
-                                    "conStart2",
-                                    "conEnd2",
-                                    "conType2",
-                                    "conText2"])
-  out['fileName'] = os.path.basename(consFile).split(".")[0]
-  return out
+  return out.frame(unordered)
+
+def orientCons(concepts, relations):
+  """
+    Takes unordered concept pairs (see extractCons) and flips the pairs
+    whose relation is annotated in the opposite order, so that they merge
+    with the relation table. Flipped pairs are marked in 'swapped'.
+  """
+  keys = set(zip(relations.lineNum,
+                 relations.conStart1,
+                 relations.conEnd1,
+                 relations.conStart2,
+                 relations.conEnd2))
+  flip = np.array([(l, s2, e2, s1, e1) in keys and
+                   (l, s1, e1, s2, e2) not in keys
+                   for l, s1, e1, s2, e2 in zip(concepts.lineNum,
+                                                concepts.conStart1,
+                                                concepts.conEnd1,
+                                                concepts.conStart2,
+                                                concepts.conEnd2)],
+                  dtype=bool)
+  if not flip.any():
+    return concepts
+
+  for c in ["conStart", "conEnd", "conType", "conText"]:
+    # Copies, as setting the first column may write over its values.
+    first  = concepts[c + '1'].values.copy()
+    second = concepts[c + '2'].values.copy()
+    concepts[c + '1'] = np.where(flip, second, first)
+    concepts[c + '2'] = np.where(flip, first, second)
+  concepts['swapped'] = flip
+  return concepts
 
 def extractRelFromText(line):
   """
@@ -203,10 +382,27 @@ def extractTxts(txtFile):
   out['fileName'] = os.path.basename(txtFile).split(".")[0]
   return out
 
-def createTraining(cFile, tFile, rFile):
+def addText(entries, text):
+  """
+    Adds the sentence of each entry, from the text table of its document
+    (see extractTxts), by line number. The sentences are referenced from the
+    text table, not copied for each entry.
+  """
+  sentences = np.append(text['text'].values.astype(object), np.nan)
+  i = entries['lineNum'].values.astype(np.int64) - 1
+  i[(i < 0) | (i >= len(text))] = len(text)
+  entries['text'] = sentences[i]
+  return entries
+
+@cached
+def createTraining(cFile, tFile, rFile, unordered=False, prune=None):
   """
     Given the concepts, text and relation files, consilidate that
     data into a single dataframe.
+    If unordered is set, each concept pair is given once, in the order of
+    its relation if it has one (see extractCons).
+    If prune is given, pairs are removed by its rules (see Pruning), along
+    with their relations.
 
     >>> print createTraining('./i2b2_examples/concept/health.con', './i2b2_examples/txt/health.txt', './i2b2_examples/rel/health.rel').ix[0]
     lineNum                                              1
@@ -237,24 +433,37 @@ def createTraining(cFile, tFile, rFile):
     text         Treatment worsens medical problem .
     Name: 1, dtype: object
   """
-  concepts  = extractCons(cFile)
-  # Handling empty concept pairs (Relations need two concepts)
-  if type(concepts) == type(None):
-    return None
-  text      = extractTxts(tFile)
-  relations = extractRels(rFile)
-  # Handling empty relations
-  if type(relations) == type(None):
-    concepts['relType'] = np.nan
-    return pd.merge(concepts, text, how='left')
-  #  return None
+  with instrument.stage('pairing') as s:
+    concepts  = extractCons(cFile, unordered, prune)
+    # Handling empty concept pairs (Relations need two concepts)
+    if type(concepts) == type(None):
+      return None
+    s.rows += len(concepts)
+
+  with instrument.stage('loading') as s:
+    text      = extractTxts(tFile)
+    relations = extractRels(rFile)
+    # Handling empty relations
+    if type(relations) == type(None):
+      concepts['relType'] = np.nan
+      out = addText(concepts, text)
+    #  return None
+    else:
+      if unordered:
+        concepts = orientCons(concepts, relations)
+      out = addText(pd.merge(concepts, relations,
+                             how='outer' if prune == None else 'left'), text)
+    s.rows += len(out)
 
-  return pd.merge(pd.merge(concepts, relations, how='outer'), text, how='left')
+  return out
 
-def createTesting(cFile, tFile):
+@cached
+def createTesting(cFile, tFile, unordered=False, prune=None):
   """
     Given the concepts, text and relation files, consilidate that
     data into a single dataframe.
+    If unordered is set, each concept pair is given once (see extractCons).
+    If prune is given, pairs are removed by its rules (see Pruning).
 
     >>> print createTesting('./i2b2_examples/concept/health.con', './i2b2_examples/txt/health.txt').ix[0]
     lineNum                                              1
@@ -285,15 +494,20 @@ def createTesting(cFile, tFile):
     text         Treatment worsens medical problem .
     Name: 1, dtype: object
   """
-  concepts = extractCons(cFile)
-  # Handling empty concept pairs (Relations need two concepts)
-  if type(concepts) == type(None):
-    return None
+  with instrument.stage('pairing') as s:
+    concepts = extractCons(cFile, unordered, prune)
+    # Handling empty concept pairs (Relations need two concepts)
+    if type(concepts) == type(None):
+      return None
+    s.rows += len(concepts)
   concepts["relType"] = np.nan
   
-  text = extractTxts(tFile)
-  
-  return pd.merge(concepts, text, how='left')
+  with instrument.stage('loading') as s:
+    text = extractTxts(tFile)
+    out = addText(concepts, text)
+    s.rows += len(out)
+
+  return out
 
 def filterFiles(d, extension):
   """ 
@@ -350,24 +564,50 @@ def createEntries(c_dir, t_dir, r_dir=None):
     text         This treatment improves medical problem .
     Name: 0, dtype: object
   """
-  entries = DataFrame()
-
+  # Concatenate once at the end, appending per document copies the whole
+  # table each time.
+  entries = list(iterEntries(c_dir, t_dir, r_dir))
+  if len(entries) == 0:
+    return DataFrame()
+  return pd.concat(entries, ignore_index=True).sort_index(axis=1)
+
+def iterEntries(c_dir, t_dir, r_dir=None, r_ext='rel'):
+  """
+    Yields the table of data for each document in the given directories,
+    one document at a time, so the corpus need not be held in memory.
+    Documents without concept pairs are skipped.
+    r_ext is the extension of the relation files (i.e. 'pred' for predictions).
+    >>> [e.shape for e in iterEntries('./i2b2_examples/concept', './i2b2_examples/txt/')]
+    [(22, 12), (22, 12)]
+    >>> sorted(e.fileName[0] for e in iterEntries('./i2b2_examples/concept', './i2b2_examples/txt/', './i2b2_examples/rel/'))
+    ['health', 'health2']
+  """
   txt = filterFiles(t_dir, 'txt')
   con = filterFiles(c_dir, 'con')
-  
+
   if r_dir:
-    rel = filterFiles(r_dir, 'rel')
+    rel = filterFiles(r_dir, r_ext)
+  else:
+    rel = [None] * len(con)
 
-    for t,c,r in zip(txt, con, rel):
+  for t,c,r in zip(txt, con, rel):
+    assert docName(t) == docName(c)
+    if r:
+      assert docName(r) == docName(c)
       entry = createTraining(c, t, r)
-      if type(entry) != type(None):
-        entries = entries.append(entry, ignore_index=True)
-  else:
-    for t,c in zip(txt, con):
+    else:
       entry = createTesting(c, t)
-      if type(entry) != type(None):
-        entries = entries.append(entry, ignore_index=True)
-  return entries
+    if type(entry) != type(None):
+      yield entry
+
+def docName(f):
+  """
+    Returns the document name of a file, which is shared by its
+    concept, text, relation and parse files.
+    >>> docName('./i2b2_examples/concept/health.con')
+    'health'
+  """
+  return os.path.basename(f).split(".")[0]
 
 if __name__ == "__main__":
   import doctest
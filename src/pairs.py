@@ -0,0 +1,206 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : pairs.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Compact store of the concept pairs of a document.
+           Pairs are rows of a numpy structured array of integers: token
+           offsets, interned concept type codes and indices into the
+           document's table of concept texts, so a pair takes a few dozen
+           bytes and no Python objects. Strings are kept once per document
+           and only referenced by the tables built from the store (see
+           frame). Concepts are indexed by line and token position, to
+           measure pairs for pruning (see note.Pruning).
+
+"""
+
+import numpy as np
+from pandas import DataFrame
+
+# Concept types, interned as small integer codes. Unknown types are added.
+TYPES = ['test', 'treatment', 'problem']
+_codes = dict((t, i) for i, t in enumerate(TYPES))
+
+def typeCode(t):
+  """
+    >>> typeCode('problem')
+    2
+  """
+  if t not in _codes:
+    _codes[t] = len(TYPES)
+    TYPES.append(t)
+  return _codes[t]
+
+# A concept pair, the first concept then the second.
+PAIR = np.dtype([('lineNum',   np.int32),
+                 ('conStart1', np.int32),
+                 ('conEnd1',   np.int32),
+                 ('conType1',  np.int8),
+                 ('conText1',  np.int32),
+                 ('conStart2', np.int32),
+                 ('conEnd2',   np.int32),
+                 ('conType2',  np.int8),
+                 ('conText2',  np.int32),
+                 ('swapped',   np.bool_)])
+
+# Columns of the tables built from pairs (see note.extractCons).
+COLUMNS = ['lineNum', 'conStart1', 'conEnd1', 'conType1', 'conText1',
+           'conStart2', 'conEnd2', 'conType2', 'conText2']
+
+def _position(line, token):
+  """ Key of a token of the document, ordered by line then token. """
+  return line.astype(np.int64) * 2**32 + token
+
+class Pairs(object):
+  """
+    The concept pairs of a document, from its concepts as given by
+    note.extractConsFromText. Pairs are made of concepts on the same line,
+    in the order of note.pairCons.
+
+    >>> cons = [(1, 3, 4, 'problem', 'medical problem'),
+    ...         (1, 0, 1, 'treatment', 'This treatment'),
+    ...         (2, 0, 0, 'test', 'Test')]
+    >>> p = Pairs('health', cons)
+    >>> len(p), p.texts
+    (2, ['medical problem', 'This treatment', 'Test'])
+    >>> [(x['conStart1'], x['conStart2']) for x in p.pairs]
+    [(3, 0), (0, 3)]
+    >>> [(x['conStart1'], x['conStart2']) for x in Pairs('h', cons, True).pairs]
+    [(0, 3)]
+  """
+  __slots__ = ('name', 'pairs', 'texts', 'index')
+
+  def __init__(self, name, concepts, unordered=False):
+    self.name  = name
+    self.texts = list()
+
+    index = dict()
+    cons = np.zeros(len(concepts), dtype=[('line', np.int32),
+                                          ('start', np.int32),
+                                          ('end', np.int32),
+                                          ('type', np.int8),
+                                          ('text', np.int32)])
+    for k, (line, start, end, t, text) in enumerate(concepts):
+      if text not in index:
+        index[text] = len(self.texts)
+        self.texts.append(text)
+      cons[k] = (line, start, end, typeCode(t), index[text])
+    # The concepts by line and token position (see between).
+    self.index = np.sort(_position(cons['line'], cons['start']))
+
+    # Every ordered pair (i, j) of concepts on the same line, ordered by i
+    # then j, as pairCons gives them.
+    first  = list()
+    second = list()
+    order = np.argsort(cons['line'], kind='mergesort')
+    bounds = np.flatnonzero(np.diff(cons['line'][order])) + 1
+    for group in np.split(order, bounds):
+      if len(group) < 2:
+        continue
+      i, j = np.meshgrid(group, group, indexing='ij')
+      keep = i < j if unordered else i != j
+      first.append(i[keep])
+      second.append(j[keep])
+
+    self.pairs = np.zeros(sum(len(f) for f in first), dtype=PAIR)
+    if len(self.pairs) == 0:
+      return
+    i = np.concatenate(first)
+    j = np.concatenate(second)
+    sort = np.lexsort((j, i))
+    i, j = i[sort], j[sort]
+
+    if unordered:
+      # Each pair in the order its concepts appear on the line.
+      flip = ((cons['start'][i] > cons['start'][j]) |
+              ((cons['start'][i] == cons['start'][j]) &
+               (cons['end'][i] > cons['end'][j])))
+      i, j = np.where(flip, j, i), np.where(flip, i, j)
+
+    a = cons[i]
+    b = cons[j]
+    p = self.pairs
+    p['lineNum']   = a['line']
+    p['conStart1'] = a['start']
+    p['conEnd1']   = a['end']
+    p['conType1']  = a['type']
+    p['conText1']  = a['text']
+    p['conStart2'] = b['start']
+    p['conEnd2']   = b['end']
+    p['conType2']  = b['type']
+    p['conText2']  = b['text']
+
+  def __len__(self):
+    return len(self.pairs)
+
+  def select(self, keep):
+    """ Keeps the pairs where keep is true. """
+    self.pairs = self.pairs[keep]
+
+  def _spans(self):
+    """ The end of the first concept of each pair on its line, and the
+        start of the second. """
+    p = self.pairs
+    first = p['conStart1'] <= p['conStart2']
+    return (np.where(first, p['conEnd1'], p['conEnd2']),
+            np.where(first, p['conStart2'], p['conStart1']))
+
+  def distance(self):
+    """
+      The number of tokens between the concepts of each pair.
+      >>> cons = [(1, 0, 1, 'treatment', 'a'), (1, 3, 3, 'test', 'b'),
+      ...         (1, 9, 10, 'problem', 'c')]
+      >>> list(Pairs('h', cons, True).distance())
+      [1, 7, 5]
+    """
+    end, start = self._spans()
+    return np.maximum(start - end - 1, 0)
+
+  def between(self):
+    """
+      The number of concepts starting between the concepts of each pair.
+      >>> cons = [(1, 0, 1, 'treatment', 'a'), (1, 3, 3, 'test', 'b'),
+      ...         (1, 9, 10, 'problem', 'c')]
+      >>> list(Pairs('h', cons, True).between())
+      [0, 1, 0]
+    """
+    end, start = self._spans()
+    line = self.pairs['lineNum']
+    out = (np.searchsorted(self.index, _position(line, start), 'left') -
+           np.searchsorted(self.index, _position(line, end), 'right'))
+    return np.maximum(out, 0)
+
+  def nbytes(self):
+    """ Size of the pairs and of the strings they refer to. """
+    return self.pairs.nbytes + sum(len(t) for t in self.texts)
+
+  def frame(self, unordered=False):
+    """
+      Returns the pairs as a table, with the columns of note.extractCons.
+      Types and texts refer to the strings of the store, they are not
+      copied for each pair.
+    """
+    types = np.array(TYPES, dtype=object)
+    texts = np.array(self.texts, dtype=object)
+    p = self.pairs
+    data = dict()
+    for c in COLUMNS:
+      if c.startswith('conType'):
+        data[c] = types[p[c]]
+      elif c.startswith('conText'):
+        data[c] = texts[p[c]]
+      else:
+        data[c] = p[c].astype(np.int64)
+    out = DataFrame(data, columns=COLUMNS)
+    out['fileName'] = self.name
+    if unordered:
+      out['swapped'] = p['swapped']
+    return out
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod()
@@ -0,0 +1,219 @@
+"""
+ Text-Machine Lab: CliRel
+
+ File Name : server.py
+
+ Creation Date : 18-10-2026
+
+ Created By : Text-Machine Lab
+
+ Purpose : Local HTTP server that keeps a model loaded and predicts
+           documents on request, so the model, its libraries and (for kim
+           with --engine python) its svms are only loaded once.
+
+           POST /predict  {"documents": [doc, ...]}
+             Each doc is either {"conceptFile": path, "textFile": path} or
+             {"name": name, "concept": text, "text": text}, the contents of
+             its concept and text files. Answers
+             {"predictions": [{"name": name, "relations": [line, ...]}],
+              "ms": milliseconds}
+           GET /stats
+             Requests, documents, errors, throughput and latency
+             percentiles since the server started.
+
+           Started by: clirel serve model [--port N] [model options]
+
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import tempfile
+import threading
+from collections import deque
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+import note
+
+def absPath(path):
+  """ Return absolute path from where this file is located """
+  return os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+
+PRED_DIR = absPath('../predictions')
+
+def percentile(values, p):
+  """
+    Nearest rank percentile of a sorted list.
+    >>> percentile([10, 20, 30, 40], 50)
+    20
+    >>> percentile([10, 20, 30, 40], 99)
+    40
+    >>> percentile([], 50)
+  """
+  if not values:
+    return None
+  rank = int(math.ceil(p / 100.0 * len(values))) - 1
+  return values[max(0, min(rank, len(values) - 1))]
+
+class Stats(object):
+  """
+    Request counters, with the latencies of the last window requests.
+    >>> s = Stats()
+    >>> s.add(0.010, 1); s.add(0.030, 2)
+    >>> d = s.asDict()
+    >>> d['requests'], d['documents'], d['latencyMs']['p50']
+    (2, 3, 10.0)
+  """
+
+  def __init__(self, window=1000):
+    self.start     = time.time()
+    self.requests  = 0
+    self.documents = 0
+    self.errors    = 0
+    self.latencies = deque(maxlen=window)
+    self.lock      = threading.Lock()
+
+  def add(self, seconds, documents):
+    with self.lock:
+      self.requests  += 1
+      self.documents += documents
+      self.latencies.append(seconds)
+
+  def error(self):
+    with self.lock:
+      self.errors += 1
+
+  def asDict(self):
+    with self.lock:
+      up = time.time() - self.start
+      lat = sorted(self.latencies)
+      return {'uptime':    up,
+              'requests':  self.requests,
+              'documents': self.documents,
+              'errors':    self.errors,
+              'requestsPerSecond':  self.requests / up if up > 0 else 0.0,
+              'documentsPerSecond': self.documents / up if up > 0 else 0.0,
+              'latencyMs': dict(('p%d' % p, percentile(lat, p) * 1000
+                                            if lat else None)
+                                for p in (50, 90, 99))}
+
+class ModelServer(HTTPServer):
+  """
+    Serves one model, loaded when the server is created. Requests are
+    handled one at a time, as models write their predictions to the
+    predictions directory.
+  """
+
+  def __init__(self, address, model_path, model_flags=None):
+    HTTPServer.__init__(self, address, Handler)
+    import clirel
+    self.model = clirel.loadModel(model_path)
+    self.flags = model_flags or list()
+    self.stats = Stats()
+
+  def predict(self, docs):
+    """
+      Predicts the documents (see the module description), returns the
+      relation lines of each.
+    """
+    tmp = tempfile.mkdtemp()
+    try:
+      data = list()
+      for d in docs:
+        if 'conceptFile' in d:
+          data.append((d['conceptFile'], d['textFile']))
+          continue
+        # Contents are written to files, named as the document.
+        name = os.path.basename(d['name'])
+        if not name:
+          raise ValueError('Invalid document name: %r' % d['name'])
+        paths = list()
+        for key, sub, ext in [('concept', 'concept', 'con'),
+                              ('text', 'txt', 'txt')]:
+          if not os.path.isdir(os.path.join(tmp, sub)):
+            os.makedirs(os.path.join(tmp, sub))
+          paths.append(os.path.join(tmp, sub, '%s.%s' % (name, ext)))
+          with open(paths[-1], 'w') as f:
+            f.write(d[key].encode('utf-8'))
+        data.append(tuple(paths))
+
+      if hasattr(self.model, 'stream'):
+        names = list(self.model.stream(iter(data), self.flags))
+      else:
+        out = self.model.predict(data, self.flags)
+        if out:
+          raise ValueError(out)
+        names = [note.docName(t) for c, t in data]
+    finally:
+      shutil.rmtree(tmp)
+
+    out = list()
+    for name in names:
+      with open(os.path.join(PRED_DIR, name + '.pred'), 'r') as f:
+        out.append({'name': name,
+                    'relations': [l.rstrip('\n') for l in f if l.strip()]})
+    return out
+
+class Handler(BaseHTTPRequestHandler):
+
+  def do_GET(self):
+    if self.path == '/stats':
+      self.reply(200, self.server.stats.asDict())
+    else:
+      self.reply(404, {'error': 'Not found: %s' % self.path})
+
+  def do_POST(self):
+    if self.path != '/predict':
+      self.reply(404, {'error': 'Not found: %s' % self.path})
+      return
+
+    start = time.time()
+    try:
+      length = int(self.headers.getheader('content-length', 0))
+      docs = json.loads(self.rfile.read(length))['documents']
+      out = self.server.predict(docs)
+    except (ValueError, KeyError, TypeError, IOError) as e:
+      self.server.stats.error()
+      self.reply(400, {'error': str(e)})
+      return
+    except Exception as e:
+      # The model failed (i.e. svm_classify), the request may be fine.
+      self.server.stats.error()
+      self.log_error('Prediction failed: %r', e)
+      self.reply(500, {'error': str(e)})
+      return
+    seconds = time.time() - start
+    self.server.stats.add(seconds, len(docs))
+    self.reply(200, {'predictions': out, 'ms': seconds * 1000})
+
+  def reply(self, code, data):
+    body = json.dumps(data)
+    self.send_response(code)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, format, *args):
+    # Requests are counted in /stats instead.
+    pass
+
+def serve(model_path, model_flags=None, port=8642, host='127.0.0.1'):
+  """
+    Loads the model and serves it until interrupted.
+  """
+  server = ModelServer((host, port), model_path, model_flags)
+  print "Serving %s on http://%s:%d" % (model_path, host, port)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+
+if __name__ == '__main__':
+  import doctest
+  doctest.testmod()